@@ -0,0 +1,107 @@
+"""Shared helpers for the benchmark scripts in this directory."""
+import itertools
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SYLLABLES = ("ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "be", "da",
+             "fe", "go", "hu", "ji", "pa", "ze")
+BATCH_SIZE = 5000
+PASSWORD = "benchmark-password"
+
+
+def prepare_environment(database_path, **overrides):
+    # Config reads the environment, so this must run before flaskblog is imported
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("MAIL_PORT", "25")
+    os.environ["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{database_path}"
+    for key, value in overrides.items():
+        if value is not None:
+            os.environ[key] = str(value)
+
+
+def vocabulary(rng, size=20_000):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    words = sorted(words)
+    rng.shuffle(words)
+    # Zipf-like weights so a few words are common and most are rare
+    return words, list(itertools.accumulate(1 / (rank + 1)
+                                            for rank in range(len(words))))
+
+
+def seed(rng, users, posts, words, weights, password_hash="x"):
+    from flaskblog import db
+    from flaskblog.models import Post, User
+    from flaskblog.posts.utils import check_post_stats
+
+    db.create_all()
+    for first in range(0, users, BATCH_SIZE):
+        db.session.execute(User.__table__.insert(), [
+            {"username": f"user{i}", "email": f"user{i}@example.com",
+             "img_file": "default.jpg", "password": password_hash}
+            for i in range(first, min(users, first + BATCH_SIZE))])
+    start = datetime(2020, 1, 1)
+    batch = []
+    for i in range(posts):
+        when = start + timedelta(minutes=i)
+        batch.append({
+            "title": " ".join(rng.choices(words, cum_weights=weights, k=6)),
+            "content": " ".join(rng.choices(words, cum_weights=weights,
+                                              k=rng.randint(40, 200))),
+            "date_posted": when, "updated_at": when,
+            "user_id": rng.randint(1, users)})
+        if len(batch) == BATCH_SIZE:
+            db.session.execute(Post.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(Post.__table__.insert(), batch)
+    db.session.commit()
+    check_post_stats(repair=True)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(samples):
+    if not samples:
+        return {}
+    return {"p50_ms": percentile(samples, 50) * 1000,
+            "p95_ms": percentile(samples, 95) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000,
+            "mean_ms": statistics.mean(samples) * 1000}
+
+
+def peak_rss_mb():
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(results, output=None):
+    results = {"commit": git_revision(), "python": platform.python_version(),
+               "created_at": datetime.utcnow().isoformat(), **results}
+    print(json.dumps(results, indent=2))
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,218 @@
+"""Measure latency, throughput and SQL query counts of the blog's hot endpoints.
+
+    python benchmarks/http_bench.py --users 1000 --posts 100000
+    python benchmarks/http_bench.py --server --concurrency 8 --output run.json
+
+Requests go through the Flask test client by default, or through a threaded
+Werkzeug WSGI server over real sockets with --server.
+"""
+import argparse
+import http.client
+import os
+import random
+import tempfile
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from urllib.parse import urlencode
+
+from common import (PASSWORD, peak_rss_mb, prepare_environment, seed,
+                    summarize, vocabulary, write_results)
+
+SCENARIOS = ("home", "home_page", "post", "user", "login", "new_post")
+
+
+class TestClientDriver:
+    def __init__(self, app):
+        self.client = app.test_client(use_cookies=False)
+        self.cookie = None
+
+    def login(self, email):
+        response = self.client.post("/login", data={"email": email,
+                                                    "password": PASSWORD})
+        self.cookie = response.headers["Set-Cookie"].split(";", 1)[0]
+
+    def send(self, method, path, data=None, logged_in=False):
+        # Sending a fixed session cookie stops unread flashes from piling up
+        headers = {"Cookie": self.cookie} if logged_in else {}
+        return self.client.open(path, method=method, data=data,
+                                headers=headers).status_code
+
+
+class ServerDriver:
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+
+        self.server = make_server("127.0.0.1", 0, app, threaded=True)
+        self.port = self.server.server_port
+        self.cookie = None
+        self._local = threading.local()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _connection(self):
+        if not hasattr(self._local, "conn"):
+            self._local.conn = http.client.HTTPConnection("127.0.0.1", self.port)
+        return self._local.conn
+
+    def login(self, email):
+        conn = http.client.HTTPConnection("127.0.0.1", self.port)
+        conn.request("POST", "/login",
+                     urlencode({"email": email, "password": PASSWORD}),
+                     {"Content-Type": "application/x-www-form-urlencoded"})
+        response = conn.getresponse()
+        response.read()
+        self.cookie = response.getheader("Set-Cookie").split(";", 1)[0]
+        conn.close()
+
+    def send(self, method, path, data=None, logged_in=False):
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        if logged_in:
+            headers["Cookie"] = self.cookie
+        body = urlencode(data) if data else None
+        conn = self._connection()
+        try:
+            conn.request(method, path, body, headers)
+            response = conn.getresponse()
+            response.read()
+        except (http.client.HTTPException, OSError):
+            # The dev server may close keep-alive connections, reconnect once
+            conn.close()
+            conn.request(method, path, body, headers)
+            response = conn.getresponse()
+            response.read()
+        return response.status
+
+    def close(self):
+        self.server.shutdown()
+
+
+def make_request(scenario, rng, users, posts, per_page=5):
+    if scenario == "home":
+        return "GET", "/home", None, False
+    if scenario == "home_page":
+        page = rng.randint(1, max(1, min(200, posts // per_page)))
+        return "GET", f"/home?page={page}", None, False
+    if scenario == "post":
+        return "GET", f"/post/{rng.randint(1, posts)}", None, False
+    if scenario == "user":
+        return "GET", f"/user/user{rng.randrange(users)}", None, False
+    if scenario == "login":
+        return "POST", "/login", {"email": f"user{rng.randrange(users)}@example.com",
+                                  "password": PASSWORD}, False
+    if scenario == "new_post":
+        return "POST", "/post/new", {"title": "Benchmark post",
+                                     "content": "Posted by the benchmark."}, True
+    raise ValueError(scenario)
+
+
+def run_scenario(driver, scenario, count, concurrency, rng, users, posts):
+    requests = [make_request(scenario, rng, users, posts) for _ in range(count)]
+    samples = []
+    statuses = defaultdict(int)
+    lock = threading.Lock()
+
+    def one(request):
+        method, path, data, logged_in = request
+        start = perf_counter()
+        status = driver.send(method, path, data, logged_in)
+        elapsed = perf_counter() - start
+        with lock:
+            samples.append(elapsed)
+            statuses[status] += 1
+
+    start = perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(one, requests))
+    else:
+        for request in requests:
+            one(request)
+    wall = perf_counter() - start
+    return {**summarize(samples), "requests": count,
+            "throughput_rps": count / wall if wall else None,
+            "statuses": {str(status): n for status, n in statuses.items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=10_000,
+                        help="Posts to seed, anywhere from 1k to 1M.")
+    parser.add_argument("--requests", type=int, default=300,
+                        help="Requests per scenario.")
+    parser.add_argument("--login-requests", type=int, default=30,
+                        help="Requests for the bcrypt-bound login scenario.")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="Run only these scenarios (repeatable).")
+    parser.add_argument("--server", action="store_true",
+                        help="Drive a real WSGI server instead of the test client.")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Client threads, only used with --server.")
+    parser.add_argument("--cache-type", default="null",
+                        help="Response cache backend, null measures rendering.")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--database", help="Reuse or keep the seeded SQLite file.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write results as JSON to this file.")
+    args = parser.parse_args()
+
+    database = args.database or os.path.join(tempfile.mkdtemp(), "bench.db")
+    reuse = os.path.exists(database)
+    prepare_environment(database, CACHE_TYPE=args.cache_type,
+                        BCRYPT_LOG_ROUNDS=args.bcrypt_rounds)
+
+    from flask import request
+    from flaskblog import create_app, hasher
+    from flaskblog.queries import query_count
+
+    app = create_app()
+    # One client hammering /login would otherwise measure the rate limiter
+    app.config.update(WTF_CSRF_ENABLED=False, MAIL_QUEUE_WORKER=False,
+                      RATELIMIT_ENABLED=False, QUERY_BUDGET_RAISE=False)
+    queries = defaultdict(list)
+
+    @app.after_request
+    def record_queries(response):
+        queries[request.endpoint].append(query_count())
+        return response
+
+    rng = random.Random(args.seed)
+    seed_time = 0.0
+    if not reuse:
+        with app.app_context():
+            start = perf_counter()
+            words, weights = vocabulary(rng)
+            seed(rng, args.users, args.posts, words, weights,
+                 hasher.generate_password_hash(PASSWORD))
+            seed_time = perf_counter() - start
+
+    driver = ServerDriver(app) if args.server else TestClientDriver(app)
+    driver.login("user0@example.com")
+    concurrency = args.concurrency if args.server else 1
+    endpoints = {"home": "main.home", "home_page": "main.home",
+                 "post": "posts.post", "user": "users.user_posts",
+                 "login": "users.login", "new_post": "posts.new_post"}
+    scenarios = {}
+    for scenario in args.scenario or SCENARIOS:
+        queries.clear()
+        count = args.login_requests if scenario == "login" else args.requests
+        result = run_scenario(driver, scenario, count, concurrency, rng,
+                              args.users, args.posts)
+        counts = queries.get(endpoints[scenario], [])
+        result["sql_queries_mean"] = sum(counts) / len(counts) if counts else None
+        result["sql_queries_max"] = max(counts, default=None)
+        scenarios[scenario] = result
+    if args.server:
+        driver.close()
+
+    write_results({"benchmark": "http", "driver": "server" if args.server else "test_client",
+                   "users": args.users, "posts": args.posts,
+                   "concurrency": concurrency, "cache_type": args.cache_type,
+                   "bcrypt_rounds": args.bcrypt_rounds, "seed_seconds": seed_time,
+                   "scenarios": scenarios, "peak_rss_mb": peak_rss_mb()},
+                  args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Measure what the rate limiter adds to requests that are let through.
+
+    python benchmarks/ratelimit_bench.py --iterations 20000
+    python benchmarks/ratelimit_bench.py --storage sqlite --output limiter.json
+
+Buckets are sized so nothing is ever refused, which is the path every
+legitimate request takes.
+"""
+import argparse
+import os
+import tempfile
+from time import perf_counter, time
+
+from common import peak_rss_mb, prepare_environment, summarize, write_results
+
+STORAGES = ("memory", "sqlite")
+
+
+def time_backend(backend, iterations, keys):
+    samples = []
+    for i in range(iterations):
+        n = i % keys
+        key = f"bench:10.0.{n // 256}.{n % 256}"
+        start = perf_counter()
+        backend.take(key, 1e9, 1e9, time())
+        samples.append(perf_counter() - start)
+    return summarize(samples)
+
+
+def time_requests(client, path, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = perf_counter()
+        client.post(path)
+        samples.append(perf_counter() - start)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=10_000)
+    parser.add_argument("--keys", type=int, default=1000,
+                        help="Distinct client addresses to spread takes over.")
+    parser.add_argument("--storage", action="append", choices=STORAGES,
+                        help="Backends to measure (repeatable), default all.")
+    parser.add_argument("--output", help="Write results as JSON to this file.")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    prepare_environment(os.path.join(directory, "bench.db"))
+
+    from flaskblog import create_app, limiter
+    from flaskblog.ratelimit import MemoryBuckets, SQLiteBuckets
+
+    app = create_app()
+    app.config.update(WTF_CSRF_ENABLED=False, MAIL_QUEUE_WORKER=False)
+
+    def view():
+        return ""
+
+    app.add_url_rule("/bench/bare", "bench_bare", view, methods=["POST"])
+    app.add_url_rule("/bench/limited", "bench_limited",
+                     limiter.limit("bench", 10 ** 9, 1)(view), methods=["POST"])
+    client = app.test_client()
+
+    results = {}
+    for storage in args.storage or STORAGES:
+        if storage == "memory":
+            limiter.backend = MemoryBuckets(max(args.keys, 1))
+        else:
+            limiter.backend = SQLiteBuckets(os.path.join(directory, "ratelimit.db"))
+        take = time_backend(limiter.backend, args.iterations, args.keys)
+        bare = time_requests(client, "/bench/bare", args.iterations)
+        limited = time_requests(client, "/bench/limited", args.iterations)
+        results[storage] = {
+            "take": take, "bare_request": bare, "limited_request": limited,
+            "overhead_p50_us": (limited["p50_ms"] - bare["p50_ms"]) * 1000,
+        }
+
+    write_results({"benchmark": "ratelimit", "iterations": args.iterations,
+                   "keys": args.keys, "storages": results,
+                   "peak_rss_mb": peak_rss_mb()}, args.output)
+
+
+if __name__ == "__main__":
+    main()
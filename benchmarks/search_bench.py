@@ -0,0 +1,58 @@
+"""Compare FTS5 search latency with a LIKE scan over a seeded post table.
+
+    python benchmarks/search_bench.py --posts 100000 --queries 200
+"""
+import argparse
+import os
+import random
+import tempfile
+from time import perf_counter
+
+from common import prepare_environment, seed, summarize, vocabulary, write_results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write results as JSON to this file.")
+    args = parser.parse_args()
+
+    prepare_environment(os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+    from flaskblog import create_app
+    from flaskblog.models import Post
+    from flaskblog.search.utils import search_posts
+
+    rng = random.Random(args.seed)
+    app = create_app()
+    with app.test_request_context():
+        start = perf_counter()
+        words, weights = vocabulary(rng)
+        seed(rng, 100, args.posts, words, weights)
+        seed_time = perf_counter() - start
+
+        # Mid-frequency terms, the typical shape of a real search
+        terms = [" ".join(rng.sample(words[50:2000], k=rng.randint(1, 2)))
+                 for _ in range(args.queries)]
+        fts = []
+        for term in terms:
+            start = perf_counter()
+            search_posts(term)
+            fts.append(perf_counter() - start)
+        like = []
+        for term in terms[:max(1, args.queries // 10)]:
+            start = perf_counter()
+            Post.query.filter(Post.content.like(f"%{term}%")) \
+                .order_by(Post.date_posted.desc()).limit(10).all()
+            like.append(perf_counter() - start)
+
+    write_results({"benchmark": "search", "posts": args.posts,
+                   "queries": args.queries, "seed_seconds": seed_time,
+                   "fts5": summarize(fts), "like_scan": summarize(like)},
+                  args.output)
+
+
+if __name__ == "__main__":
+    main()
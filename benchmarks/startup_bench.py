@@ -0,0 +1,96 @@
+"""Measure how long a fresh process takes to import flaskblog and build the app.
+
+    python benchmarks/startup_bench.py --runs 20
+    python benchmarks/startup_bench.py --top 30 --output startup.json
+
+Every run is a new interpreter started with -X importtime, so the numbers
+include the real import cost a worker process pays at boot.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from time import perf_counter
+
+from common import ROOT, prepare_environment, summarize, write_results
+
+# Modules that should only load once a request actually needs them
+LAZY_MODULES = ("PIL", "flask_mail", "smtplib", "bcrypt")
+
+PROBE = """
+import json, sys
+from time import perf_counter
+start = perf_counter()
+from flaskblog import create_app
+imported = perf_counter()
+create_app()
+done = perf_counter()
+print(json.dumps({"import": imported - start, "create_app": done - imported,
+                  "loaded": [name for name in %r if name in sys.modules]}))
+"""
+
+
+def parse_importtime(stderr):
+    # Lines look like "import time: self [us] | cumulative | package"
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        cumulative[name.strip()] = int(cumulative_us)
+    return cumulative
+
+
+def run_once():
+    start = perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                           PROBE % (LAZY_MODULES,)],
+                          cwd=ROOT, capture_output=True, text=True, check=True)
+    wall = perf_counter() - start
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    return wall, result, parse_importtime(proc.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15,
+                        help="Number of slowest top-level imports to report.")
+    parser.add_argument("--output", help="Write results as JSON to this file.")
+    args = parser.parse_args()
+
+    prepare_environment(os.path.join(tempfile.mkdtemp(), "bench.db"))
+    os.environ["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [ROOT, os.environ.get("PYTHONPATH")]))
+
+    # One discarded run warms the filesystem and bytecode caches
+    run_once()
+    walls, imports, factories = [], [], []
+    modules = defaultdict(list)
+    loaded = set()
+    for _ in range(args.runs):
+        wall, result, cumulative = run_once()
+        walls.append(wall)
+        imports.append(result["import"])
+        factories.append(result["create_app"])
+        loaded.update(result["loaded"])
+        for name, micros in cumulative.items():
+            if "." not in name:
+                modules[name].append(micros / 1e6)
+
+    slowest = sorted(((name, sum(times) / len(times)) for name, times in modules.items()),
+                     key=lambda item: item[1], reverse=True)[:args.top]
+    write_results({"benchmark": "startup", "runs": args.runs,
+                   "process": summarize(walls),
+                   "import_flaskblog": summarize(imports),
+                   "create_app": summarize(factories),
+                   "slowest_imports_ms": {name: seconds * 1000 for name, seconds in slowest},
+                   "eagerly_loaded": sorted(loaded)},
+                  args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,60 @@
 
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
-from flask_mail import Mail
 from flaskblog.config import Config
+from flaskblog.cache import ResponseCache
+from flaskblog.database import (RoutingSession, configure_engines, dispose_after_fork,
+                                install_pragmas)
+from flaskblog.hashing import PasswordHasher
+from flaskblog.instrumentation import Instrumentation
+from flaskblog.mailqueue import MailQueue
+from flaskblog.ratelimit import RateLimiter
 
 
 # CREATE DATABASE
-db = SQLAlchemy()
-bcrypt = Bcrypt()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+hasher = PasswordHasher()
 login_manager = LoginManager()
 login_manager.login_view = "user.login"
 login_manager.login_message_category = "info"
-mail = Mail()
+mail_queue = MailQueue()
+cache = ResponseCache()
+instrumentation = Instrumentation()
+limiter = RateLimiter()
 
 
 def create_app(config_cls=Config):
     app = Flask(__name__)
-    app.config.from_object(Config)
+    app.config.from_object(config_cls)
 
+    configure_engines(app)
     db.init_app(app)
-    bcrypt.init_app(app)
+    install_pragmas(app, db)
+    dispose_after_fork(app)
+    hasher.init_app(app)
     login_manager.init_app(app)
-    mail.init_app(app)
+    mail_queue.init_app(app)
+    cache.init_app(app)
+    instrumentation.init_app(app)
+    limiter.init_app(app)
 
     from flaskblog.main.routes  import main
     from flaskblog.users.routes import users
     from flaskblog.posts.routes import posts
+    from flaskblog.search.routes import search
+    from flaskblog.feeds.routes import feeds
     from flaskblog.errors.handlers import errors
-    
+    from flaskblog.queries import init_query_counter
+    from flaskblog.models import init_identity_cache
+
     app.register_blueprint(users)
     app.register_blueprint(posts)
     app.register_blueprint(main)
+    app.register_blueprint(search)
+    app.register_blueprint(feeds)
     app.register_blueprint(errors)
+    init_query_counter(app)
+    init_identity_cache(app)
 
     return app
@@ -0,0 +1,97 @@
+import csv
+import json
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from time import perf_counter
+import click
+
+
+FORMATS = ("jsonl", "csv")
+
+
+def guess_format(path, fmt=None):
+    if fmt:
+        return fmt
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    return "csv" if extension == "csv" else "jsonl"
+
+
+@contextmanager
+def open_stream(path, mode):
+    if path == "-":
+        yield sys.stdin if "r" in mode else sys.stdout
+    else:
+        with open(path, mode, newline="", encoding="utf-8") as stream:
+            yield stream
+
+
+def read_rows(stream, fmt):
+    if fmt == "csv":
+        for row in csv.DictReader(stream):
+            yield {key: value for key, value in row.items() if value != ""}
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _serialize(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def write_rows(stream, fmt, fields, rows, progress):
+    if fmt == "csv":
+        writer = csv.writer(stream)
+        writer.writerow(fields)
+        for row in rows:
+            writer.writerow([_serialize(value) for value in row])
+            progress.update()
+    else:
+        for row in rows:
+            stream.write(json.dumps(dict(zip(fields, map(_serialize, row))),
+                                    ensure_ascii=False) + "\n")
+            progress.update()
+
+
+def parse_datetime(value, default=None):
+    if value in (None, ""):
+        return default
+    return datetime.fromisoformat(value)
+
+
+def chunked(iterable, size: int):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class Progress:
+    def __init__(self, label, interval=1.0):
+        self.label = label
+        self.interval = interval
+        self.count = 0
+        self.skipped = 0
+        self.started = perf_counter()
+        self._reported = self.started
+
+    def update(self, count=1, skipped=0):
+        self.count += count
+        self.skipped += skipped
+        now = perf_counter()
+        if now - self._reported >= self.interval:
+            self._reported = now
+            self._echo(now)
+
+    def _echo(self, now, prefix=""):
+        elapsed = now - self.started
+        rate = self.count / elapsed if elapsed else 0
+        skipped = f", {self.skipped} skipped" if self.skipped else ""
+        # Progress goes to stderr so exports can stream to stdout
+        click.echo(f"{prefix}{self.label}: {self.count} rows{skipped} "
+                   f"in {elapsed:.1f}s ({rate:,.0f} rows/s)", err=True)
+
+    def done(self):
+        self._echo(perf_counter(), "done ")
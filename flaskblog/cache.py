@@ -0,0 +1,249 @@
+import os
+import pickle
+import secrets
+import tempfile
+from collections import OrderedDict
+from datetime import datetime
+from functools import wraps
+from hashlib import sha1
+from threading import Lock
+from time import time
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+
+
+class NullCache:
+    def get(self, key):
+        return None
+
+    def set(self, key, value, timeout=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class MemoryCache:
+    def __init__(self, max_entries=500, default_timeout=300):
+        self.max_entries = max_entries
+        self.default_timeout = default_timeout
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires and expires < time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        timeout = self.default_timeout if timeout is None else timeout
+        expires = time() + timeout if timeout else 0
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileSystemCache:
+    def __init__(self, cache_dir, max_entries=500, default_timeout=300,
+                 prune_every=100):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.default_timeout = default_timeout
+        self.prune_every = prune_every
+        self._writes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, sha1(key.encode()).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.PickleError):
+            return None
+        if expires and expires < time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, timeout=None):
+        timeout = self.default_timeout if timeout is None else timeout
+        expires = time() + timeout if timeout else 0
+        # Pruning lists and stats the whole directory, so it only runs every
+        # prune_every writes and the cache may run over by that many entries
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            self._prune()
+        # Write to a temp file first so other workers never read a partial entry
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump((expires, value), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+
+    def _prune(self):
+        names = [n for n in os.listdir(self.cache_dir) if not n.startswith(".")]
+        if len(names) < self.max_entries:
+            return
+        paths = [os.path.join(self.cache_dir, n) for n in names]
+        paths.sort(key=lambda p: os.stat(p).st_mtime if os.path.exists(p) else 0)
+        for path in paths[:len(paths) - self.max_entries + 1]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class ResponseCache:
+    # The layout renders the latest posts sidebar on every page, so each
+    # cached page also depends on the version of these namespaces. "latest"
+    # is only bumped when the sidebar rows change
+    PAGE_NAMESPACES = ("latest",)
+
+    def __init__(self, app=None):
+        self.backend = NullCache()
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        cache_type = app.config.get("CACHE_TYPE", "memory")
+        max_entries = app.config.get("CACHE_MAX_ENTRIES", 500)
+        timeout = app.config.get("CACHE_DEFAULT_TIMEOUT", 300)
+        if cache_type == "memory":
+            self.backend = MemoryCache(max_entries, timeout)
+        elif cache_type == "filesystem":
+            cache_dir = app.config.get("CACHE_DIR") or \
+                os.path.join(app.instance_path, "cache")
+            self.backend = FileSystemCache(cache_dir, max_entries, timeout)
+        elif cache_type == "null":
+            self.backend = NullCache()
+        else:
+            raise ValueError(f"Unknown CACHE_TYPE '{cache_type}'")
+        app.extensions["response_cache"] = self
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    @staticmethod
+    def _new_version():
+        # Versions are random rather than counters, so an evicted version key
+        # can never bring back pages rendered under an older version. The
+        # time of the bump rides along for changed_at
+        return f"{secrets.token_hex(4)}-{int(time())}"
+
+    def _version(self, namespace):
+        key = f"version:{namespace}"
+        version = self.backend.get(key)
+        if version is None:
+            version = self._new_version()
+            self.backend.set(key, version, 0)
+        return version
+
+    def invalidate(self, *namespaces):
+        for namespace in namespaces:
+            self.backend.set(f"version:{namespace}", self._new_version(), 0)
+
+    def changed_at(self, *namespaces):
+        # A lost version counts as changed now, which is never too early
+        stamps = [self._version(namespace).partition("-")[2] or time()
+                  for namespace in namespaces]
+        return datetime.utcfromtimestamp(max(map(float, stamps)))
+
+    def get_fragment(self, namespace, name):
+        # The key is returned too, so a value produced later is stored under
+        # the version it was read for and a concurrent write discards it
+        key = f"fragment:{namespace}:{self._version(namespace)}:{name}"
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return key, value
+
+    def set_fragment(self, key, value, timeout=None):
+        self.backend.set(key, value, timeout)
+
+    def cached_fragment(self, namespace, name, producer, timeout=None):
+        key, value = self.get_fragment(namespace, name)
+        if value is None:
+            value = producer()
+            self.set_fragment(key, value, timeout)
+        return value
+
+    def _cacheable(self):
+        return request.method == "GET" \
+            and not current_user.is_authenticated \
+            and "_flashes" not in session
+
+    def cached_page(self, namespace, timeout=None, related=None):
+        # related(**view_args) names further namespaces the page renders, so
+        # shared data is bumped once instead of once per page
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self._cacheable():
+                    return view(*args, **kwargs)
+                ns = namespace.format(**kwargs)
+                extra = related(**kwargs) if related is not None else ()
+                versions = ":".join(self._version(name) for name in
+                                    dict.fromkeys((ns, *extra, *self.PAGE_NAMESPACES)))
+                key = f"page:{ns}:{versions}:{request.full_path}"
+                cached = self.backend.get(key)
+                if cached is not None:
+                    self.hits += 1
+                    body, status, content_type, headers = cached
+                    response = current_app.response_class(
+                        body, status=status, content_type=content_type,
+                        headers=headers)
+                    response.headers["X-Cache"] = "HIT"
+                    return response.make_conditional(request)
+                self.misses += 1
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 \
+                        and "Set-Cookie" not in response.headers \
+                        and not response.direct_passthrough:
+                    headers = [(name, value) for name, value in response.headers
+                               if name in ("ETag", "Last-Modified")]
+                    self.backend.set(key, (response.get_data(),
+                                           response.status_code,
+                                           response.content_type,
+                                           headers), timeout)
+                response.headers["X-Cache"] = "MISS"
+                return response
+            return wrapper
+        return decorator
@@ -0,0 +1,78 @@
+from datetime import timezone
+from hashlib import sha1
+from time import time
+from flask import current_app, request, session
+from flask_login import current_user
+from flaskblog import cache
+from flaskblog.posts.utils import latest_posts
+
+
+def post_version(post):
+    author = post.author
+    return f"{post.id}:{post.last_modified.timestamp()}:" \
+        f"{author.username}:{author.img_file}"
+
+
+def make_etag(*parts):
+    # Logged-in users see edit controls and a different navbar, and every
+    # page renders the latest posts sidebar
+    viewer = current_user.get_id() or "anon"
+    parts = [viewer, *parts, *latest_posts()]
+    return sha1("|".join(map(str, parts)).encode()).hexdigest()
+
+
+def page_last_modified(last_modified, *namespaces):
+    # The sidebar, usernames and avatars have no timestamp of their own, so
+    # the last bump of the namespaces covering them stands in
+    changed = cache.changed_at("latest", *namespaces)
+    return changed if last_modified is None else max(last_modified, changed)
+
+
+def feed_validators(posts, *extra):
+    etag = make_etag(posts.has_prev, posts.has_next, *extra,
+                     *(post_version(post) for post in posts.items))
+    last_modified = page_last_modified(
+        max((post.last_modified for post in posts.items), default=None),
+        *{f"author:{post.user_id}" for post in posts.items})
+    return etag, last_modified
+
+
+def _http_date(value):
+    if value is None:
+        return None
+    return value.replace(microsecond=0, tzinfo=timezone.utc)
+
+
+def not_modified(etag, last_modified=None):
+    # Pending flashed messages must be rendered, so never short-circuit them
+    if "_flashes" in session:
+        return None
+    last_modified = _http_date(last_modified)
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    elif request.if_modified_since and last_modified \
+            and not current_user.is_authenticated:
+        fresh = last_modified <= request.if_modified_since
+    else:
+        fresh = False
+    if not fresh:
+        return None
+    response = current_app.response_class(status=304)
+    return with_validators(response, etag, last_modified)
+
+
+def with_validators(response, etag, last_modified=None):
+    response = current_app.make_response(response)
+    response.set_etag(etag)
+    if current_user.is_authenticated:
+        # A date cannot tell this viewer's copy from the anonymous one, so
+        # logged-in pages revalidate by ETag only and stay out of shared caches
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    elif last_modified is not None:
+        last_modified = _http_date(last_modified)
+        # HTTP dates are whole seconds, so a date in the current second could
+        # still be followed by a change that keeps it
+        if last_modified.timestamp() < int(time()):
+            response.last_modified = last_modified
+    return response
@@ -5,7 +5,53 @@ class Config:
     MAIL_SERVER = os.environ.get("MAIL_SERVER")
     SECRET_KEY = os.environ.get("SECRET_KEY")
     SQLALCHEMY_DATABASE_URI = os.environ.get("SQLALCHEMY_DATABASE_URI")
-    MAIL_PORT = int(os.environ.get("MAIL_PORT"))
-    MAIL_USE_TLS = True
+    SQLALCHEMY_READ_URI = os.environ.get("SQLALCHEMY_READ_URI")
+    DB_READ_WRITE_SPLIT = os.environ.get("DB_READ_WRITE_SPLIT", "").lower() == "true"
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+    DB_POOL_TIMEOUT = 10
+    DB_POOL_RECYCLE = 1800
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -16000,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    }
+    MAIL_PORT = int(os.environ.get("MAIL_PORT", 587))
+    MAIL_USE_TLS = os.environ.get("MAIL_USE_TLS", "true").lower() == "true"
     MAIL_USERNAME = os.environ.get("EMAIL_USER")
-    MAIL_PASSWORD = os.environ.get("EMAIL_PASS")
\ No newline at end of file
+    MAIL_PASSWORD = os.environ.get("EMAIL_PASS")
+    FEED_COUNT_TTL = 60
+    LATEST_POSTS_SIZE = 5
+    FEED_SIZE = 20
+    FEED_DELTA_LIMIT = 500
+    USER_CACHE_TTL = 30
+    USER_CACHE_SIZE = 1000
+    QUERY_BUDGET = None
+    CACHE_TYPE = os.environ.get("CACHE_TYPE", "memory")
+    CACHE_DIR = os.environ.get("CACHE_DIR")
+    CACHE_DEFAULT_TIMEOUT = 300
+    CACHE_MAX_ENTRIES = 500
+    BCRYPT_LOG_ROUNDS = int(os.environ.get("BCRYPT_LOG_ROUNDS", 12))
+    HASH_POOL_SIZE = int(os.environ.get("HASH_POOL_SIZE", os.cpu_count() or 1))
+    HASH_MAX_PENDING = None
+    HASH_QUEUE_TIMEOUT = 0.5
+    MAIL_QUEUE_WORKER = True
+    MAIL_QUEUE_BATCH_SIZE = 50
+    MAIL_QUEUE_POLL_INTERVAL = 5
+    MAIL_QUEUE_MAX_ATTEMPTS = 8
+    MAIL_QUEUE_BACKOFF = 30
+    MAIL_QUEUE_MAX_BACKOFF = 3600
+    IMAGE_WORKERS = 2
+    RATELIMIT_ENABLED = os.environ.get("RATELIMIT_ENABLED", "true").lower() == "true"
+    RATELIMIT_STORAGE = os.environ.get("RATELIMIT_STORAGE", "memory")
+    RATELIMIT_SQLITE_PATH = os.environ.get("RATELIMIT_SQLITE_PATH")
+    RATELIMIT_MAX_KEYS = 10_000
+    INSTRUMENTATION_ENABLED = os.environ.get("INSTRUMENTATION_ENABLED", "").lower() == "true"
+    INSTRUMENTATION_SLOW_STATEMENTS = 3
+    SLOW_STATEMENT_MS = 100
+    PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+    PROFILE_THRESHOLD_MS = 500
+    PROFILE_DIR = os.environ.get("PROFILE_DIR")
\ No newline at end of file
@@ -0,0 +1,114 @@
+import sqlite3
+import weakref
+from flask import has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from flaskblog.forking import after_fork
+
+
+READ_BIND = "read"
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def _is_sqlite(uri):
+    return make_url(uri).get_backend_name() == "sqlite"
+
+
+def _is_sqlite_file(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+def _pool_options(app, uri):
+    config = app.config
+    options = {"pool_size": config["DB_POOL_SIZE"],
+               "max_overflow": config["DB_MAX_OVERFLOW"],
+               "pool_timeout": config["DB_POOL_TIMEOUT"]}
+    if _is_sqlite_file(uri):
+        # SQLAlchemy 1.4 defaults file databases to NullPool, which opens a
+        # new connection and re-runs every PRAGMA on each checkout
+        options["poolclass"] = QueuePool
+        options["connect_args"] = {"check_same_thread": False}
+    elif not _is_sqlite(uri):
+        options["pool_pre_ping"] = True
+        options["pool_recycle"] = config["DB_POOL_RECYCLE"]
+    else:
+        return {}
+    return options
+
+
+def configure_engines(app):
+    uri = app.config["SQLALCHEMY_DATABASE_URI"]
+    engine_options = app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {})
+    for key, value in _pool_options(app, uri).items():
+        engine_options.setdefault(key, value)
+
+    read_uri = app.config.get("SQLALCHEMY_READ_URI")
+    if not read_uri and app.config["DB_READ_WRITE_SPLIT"]:
+        # Without a replica, reads get their own query_only pool on the same
+        # file, which WAL lets run alongside the writer
+        read_uri = uri
+    if read_uri:
+        binds = app.config.setdefault("SQLALCHEMY_BINDS", {})
+        binds[READ_BIND] = {"url": read_uri, **_pool_options(app, read_uri)}
+
+
+def _pragma_listener(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+    return set_pragmas
+
+
+def install_pragmas(app, db):
+    pragmas = dict(app.config["SQLITE_PRAGMAS"])
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name != "sqlite":
+                continue
+            engine_pragmas = pragmas
+            if key == READ_BIND:
+                # journal_mode belongs to the file and needs a write to change
+                engine_pragmas = {name: value for name, value in pragmas.items()
+                                  if name != "journal_mode"}
+                engine_pragmas["query_only"] = "ON"
+            event.listen(engine, "connect", _pragma_listener(engine_pragmas))
+
+
+_apps = weakref.WeakSet()
+
+
+def dispose_after_fork(app):
+    _apps.add(app)
+
+
+@after_fork
+def _dispose_engines():
+    # A preloading pre-fork server creates the engines in the master, and a
+    # worker must never reuse a connection the master or a sibling holds
+    for app in list(_apps):
+        with app.app_context():
+            for engine in app.extensions["sqlalchemy"].engines.values():
+                engine.dispose(close=False)
+
+
+class RoutingSession(Session):
+    def _use_read_bind(self):
+        return has_request_context() \
+            and request.method in READ_METHODS \
+            and not self._flushing \
+            and not (self.new or self.dirty or self.deleted)
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        engines = self._db.engines
+        if bind is None and READ_BIND in engines and engine is engines.get(None) \
+                and self._use_read_bind():
+            return engines[READ_BIND]
+        return engine
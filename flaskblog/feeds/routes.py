@@ -0,0 +1,58 @@
+from flask import Blueprint, current_app, request, stream_with_context
+from flaskblog import cache
+from flaskblog.conditional import not_modified, with_validators
+from flaskblog.feeds.utils import (CONTENT_TYPES, feed_validators, generate_feed,
+                                   parse_since)
+from flaskblog.models import User
+
+feeds = Blueprint("feeds", __name__)
+
+
+def _store(chunks, key, etag, last_modified):
+    body = []
+    for chunk in chunks:
+        body.append(chunk)
+        yield chunk
+    # Only a feed that was sent in full is kept
+    cache.set_fragment(key, (etag, last_modified, "".join(body)))
+
+
+def _feed_response(fmt, namespace, username=None):
+    since = parse_since(request.args.get("since"))
+    key = cached = None
+    if since is None:
+        # The newest entries only change on writes, which bump the namespace
+        key, cached = cache.get_fragment(namespace, f"feed:{fmt}:{request.host_url}")
+    if cached is not None:
+        etag, last_modified, body = cached
+        return not_modified(etag, last_modified) or with_validators(
+            current_app.response_class(body, content_type=CONTENT_TYPES[fmt]),
+            etag, last_modified)
+
+    user = None
+    if username is not None:
+        user = User.query.filter_by(username=username).first_or_404()
+    etag, last_modified = feed_validators(fmt, user, since)
+    # Entries carry usernames, which a rename changes without touching posts
+    changed = cache.changed_at(namespace)
+    last_modified = changed if last_modified is None else max(last_modified, changed)
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
+    chunks = generate_feed(fmt, user, since, last_modified)
+    if key is not None:
+        chunks = _store(chunks, key, etag, last_modified)
+    return with_validators(
+        current_app.response_class(stream_with_context(chunks),
+                                   content_type=CONTENT_TYPES[fmt]),
+        etag, last_modified)
+
+
+@feeds.route("/feed.<any(atom, json):fmt>")
+def site_feed(fmt: str):
+    return _feed_response(fmt, "home")
+
+
+@feeds.route("/user/<string:username>/feed.<any(atom, json):fmt>")
+def user_feed(username: str, fmt: str):
+    return _feed_response(fmt, f"user:{username}", username)
@@ -0,0 +1,130 @@
+import json
+from datetime import datetime, timezone
+from hashlib import sha1
+from xml.sax.saxutils import escape
+from flask import abort, current_app, request, url_for
+from sqlalchemy import func, select
+from flaskblog import db
+from flaskblog.models import Post, User
+
+
+CONTENT_TYPES = {"atom": "application/atom+xml; charset=utf-8",
+                 "json": "application/feed+json; charset=utf-8"}
+# Rows added before updated_at existed may not have been backfilled
+LAST_MODIFIED = func.coalesce(Post.updated_at, Post.date_posted)
+ENTRY_COLUMNS = (Post.id, Post.title, Post.content, Post.date_posted,
+                 LAST_MODIFIED, User.username)
+
+
+def parse_since(value):
+    if not value:
+        return None
+    try:
+        since = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        abort(400, "since must be an ISO 8601 timestamp")
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return since
+
+
+def feed_query(columns, user=None, since=None):
+    query = select(*columns).join(User, User.id == Post.user_id)
+    if user is not None:
+        query = query.where(Post.user_id == user.id)
+    if since is not None:
+        # Deltas carry edits as well as new posts, oldest change first. The
+        # filter stays on the indexed column, so rows without updated_at
+        # only show up in full feeds
+        return query.where(Post.updated_at > since) \
+            .order_by(Post.updated_at, Post.id) \
+            .limit(current_app.config["FEED_DELTA_LIMIT"])
+    return query.order_by(Post.date_posted.desc(), Post.id.desc()) \
+        .limit(current_app.config["FEED_SIZE"])
+
+
+def feed_validators(fmt, user=None, since=None):
+    rows = db.session.execute(
+        feed_query((Post.id, LAST_MODIFIED, User.username), user, since)).all()
+    parts = [fmt, request.host_url, user and user.username, since,
+             *(f"{post_id}:{updated_at.timestamp()}:{username}"
+               for post_id, updated_at, username in rows)]
+    etag = sha1("|".join(map(str, parts)).encode()).hexdigest()
+    return etag, max((updated_at for _, updated_at, _ in rows), default=None)
+
+
+def _timestamp(value):
+    return f"{value:%Y-%m-%dT%H:%M:%SZ}"
+
+
+def _attr(value):
+    return escape(value, {'"': "&quot;"})
+
+
+def _links(user):
+    if user is None:
+        return "Flask Blog", url_for("main.home", _external=True)
+    return f"Flask Blog - {user.username}", \
+        url_for("users.user_posts", username=user.username, _external=True)
+
+
+def _atom_head(user, updated):
+    title, page_url = _links(user)
+    return '<?xml version="1.0" encoding="utf-8"?>\n' \
+        '<feed xmlns="http://www.w3.org/2005/Atom">\n' \
+        f"  <title>{escape(title)}</title>\n" \
+        f"  <id>{escape(request.base_url)}</id>\n" \
+        f'  <link rel="self" href="{_attr(request.base_url)}"/>\n' \
+        f'  <link rel="alternate" type="text/html" href="{_attr(page_url)}"/>\n' \
+        f"  <updated>{_timestamp(updated)}</updated>\n"
+
+
+def _atom_entry(row):
+    post_id, title, content, date_posted, updated_at, username = row
+    url = url_for("posts.post", post_id=post_id, _external=True)
+    author_url = url_for("users.user_posts", username=username, _external=True)
+    return "  <entry>\n" \
+        f"    <title>{escape(title)}</title>\n" \
+        f'    <link href="{_attr(url)}"/>\n' \
+        f"    <id>{escape(url)}</id>\n" \
+        f"    <published>{_timestamp(date_posted)}</published>\n" \
+        f"    <updated>{_timestamp(updated_at)}</updated>\n" \
+        f"    <author><name>{escape(username)}</name>" \
+        f"<uri>{escape(author_url)}</uri></author>\n" \
+        f'    <content type="text">{escape(content)}</content>\n' \
+        "  </entry>\n"
+
+
+def _json_head(user, updated):
+    title, page_url = _links(user)
+    head = json.dumps({"version": "https://jsonfeed.org/version/1.1",
+                       "title": title, "home_page_url": page_url,
+                       "feed_url": request.base_url}, ensure_ascii=False)
+    return head[:-1] + ', "items": [\n'
+
+
+def _json_entry(row):
+    post_id, title, content, date_posted, updated_at, username = row
+    url = url_for("posts.post", post_id=post_id, _external=True)
+    return json.dumps({
+        "id": url, "url": url, "title": title, "content_text": content,
+        "date_published": _timestamp(date_posted),
+        "date_modified": _timestamp(updated_at),
+        "authors": [{"name": username, "url": url_for(
+            "users.user_posts", username=username, _external=True)}],
+    }, ensure_ascii=False)
+
+
+# head, entry, separator between entries, tail
+WRITERS = {"atom": (_atom_head, _atom_entry, "", "</feed>\n"),
+           "json": (_json_head, _json_entry, ",\n", "\n]}\n")}
+
+
+def generate_feed(fmt, user=None, since=None, updated=None):
+    head, entry, separator, tail = WRITERS[fmt]
+    yield head(user, updated or datetime.utcnow())
+    rows = db.session.execute(feed_query(ENTRY_COLUMNS, user, since)
+                              .execution_options(yield_per=100))
+    for number, row in enumerate(rows):
+        yield (separator if number else "") + entry(row)
+    yield tail
@@ -0,0 +1,30 @@
+import os
+import weakref
+
+
+_callbacks = []
+
+
+def after_fork(callback):
+    # Bound methods are held weakly, so registering never keeps an app,
+    # extension or backend alive
+    if hasattr(callback, "__self__"):
+        _callbacks.append(weakref.WeakMethod(callback))
+    else:
+        _callbacks.append(lambda: callback)
+    return callback
+
+
+def _run_after_fork():
+    # Pools, threads and connections do not survive fork, so everything that
+    # holds one drops it here and recreates it on first use in the child
+    for ref in list(_callbacks):
+        callback = ref()
+        if callback is None:
+            _callbacks.remove(ref)
+        else:
+            callback()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_run_after_fork)
@@ -0,0 +1,113 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+from itertools import repeat
+from threading import BoundedSemaphore, Lock
+from time import perf_counter
+from werkzeug.exceptions import ServiceUnavailable
+from flaskblog.forking import after_fork
+from flaskblog.metrics import Histogram, record_timing
+
+
+class HasherBusy(ServiceUnavailable):
+    description = "Too many sign-in requests right now. Please try again shortly."
+
+
+def _hash(password: bytes, rounds: int, prefix: bytes):
+    import bcrypt
+
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds, prefix)).decode("utf-8")
+
+
+def _check(pw_hash: bytes, password: bytes):
+    import bcrypt
+
+    return bcrypt.checkpw(password, pw_hash)
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.prefix = "2b"
+        self.handle_long_passwords = False
+        self.pool_size = 0
+        self.queue_timeout = 0.5
+        self.histograms = {"hash": Histogram(), "verify": Histogram()}
+        self._slots = None
+        self._pool = None
+        self._pool_lock = Lock()
+        after_fork(self._reset_pool)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.rounds = app.config.get("BCRYPT_LOG_ROUNDS", 12)
+        self.prefix = app.config.get("BCRYPT_HASH_PREFIX", "2b")
+        self.handle_long_passwords = app.config.get(
+            "BCRYPT_HANDLE_LONG_PASSWORDS", False)
+        self.pool_size = app.config.get("HASH_POOL_SIZE", os.cpu_count() or 1)
+        self.queue_timeout = app.config.get("HASH_QUEUE_TIMEOUT", 0.5)
+        max_pending = app.config.get("HASH_MAX_PENDING") or 4 * max(self.pool_size, 1)
+        self._slots = BoundedSemaphore(max_pending)
+        app.extensions["password_hasher"] = self
+
+    def _reset_pool(self):
+        self._pool = None
+        self._pool_lock = Lock()
+
+    def _executor(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.pool_size)
+            return self._pool
+
+    def _run(self, kind, func, *args):
+        start = perf_counter()
+        if not self.pool_size:
+            result = func(*args)
+        else:
+            if not self._slots.acquire(timeout=self.queue_timeout):
+                raise HasherBusy(retry_after=1)
+            try:
+                result = self._executor().submit(func, *args).result()
+            finally:
+                self._slots.release()
+        elapsed = perf_counter() - start
+        self.histograms[kind].observe(elapsed)
+        record_timing("bcrypt", elapsed)
+        return result
+
+    def _prepare(self, password):
+        if isinstance(password, str):
+            password = password.encode("utf-8")
+        if self.handle_long_passwords:
+            password = sha256(password).hexdigest().encode("utf-8")
+        return password
+
+    def generate_password_hash(self, password, rounds=None):
+        return self._run("hash", _hash, self._prepare(password),
+                         rounds or self.rounds, self.prefix.encode("utf-8"))
+
+    def generate_password_hashes(self, passwords, rounds=None):
+        # Bulk imports bypass the request back-pressure and keep every
+        # pool worker busy with chunks of passwords
+        passwords = [self._prepare(password) for password in passwords]
+        args = (passwords, repeat(rounds or self.rounds), repeat(self.prefix.encode("utf-8")))
+        if not self.pool_size:
+            return list(map(_hash, *args))
+        chunksize = max(1, len(passwords) // (4 * self.pool_size))
+        return list(self._executor().map(_hash, *args, chunksize=chunksize))
+
+    def check_password_hash(self, pw_hash, password):
+        if isinstance(pw_hash, str):
+            pw_hash = pw_hash.encode("utf-8")
+        return self._run("verify", _check, pw_hash, self._prepare(password))
+
+    def needs_rehash(self, pw_hash):
+        if isinstance(pw_hash, bytes):
+            pw_hash = pw_hash.decode("utf-8")
+        try:
+            _, prefix, cost, _ = pw_hash.split("$", 3)
+            return prefix != self.prefix or int(cost) != self.rounds
+        except ValueError:
+            return True
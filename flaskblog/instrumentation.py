@@ -0,0 +1,192 @@
+import cProfile
+import heapq
+import os
+import random
+from collections import defaultdict
+from datetime import datetime
+from threading import Lock
+from time import perf_counter
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from flaskblog.metrics import Histogram, record_timing
+
+
+class EndpointStats:
+    def __init__(self):
+        self.duration = Histogram()
+        self.requests = 0
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.render_seconds = 0.0
+        self.bcrypt_seconds = 0.0
+
+
+class Instrumentation:
+    def __init__(self, app=None):
+        self.enabled = False
+        self.endpoints = defaultdict(EndpointStats)
+        self.templates = defaultdict(lambda: [0, 0.0])
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("INSTRUMENTATION_ENABLED", False)
+        app.extensions["instrumentation"] = self
+        if not self.enabled:
+            return
+        _install_sql_listeners()
+        _install_template_timer(app, self)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.add_url_rule("/metrics", "metrics", self.metrics_view)
+
+    def _start(self):
+        g.timings = {}
+        g.sql_statements = []
+        g.request_started = perf_counter()
+        rate = current_app.config.get("PROFILE_SAMPLE_RATE", 0)
+        if rate and random.random() < rate:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    def _finish(self, response):
+        if "request_started" not in g:
+            return response
+        total = perf_counter() - g.request_started
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.disable()
+            if total * 1000 >= current_app.config.get("PROFILE_THRESHOLD_MS", 500):
+                self._dump_profile(profiler, total)
+
+        timings = g.timings
+        statements = g.sql_statements
+        with self._lock:
+            stats = self.endpoints[request.endpoint or "unmatched"]
+            stats.requests += 1
+            stats.duration.observe(total)
+            stats.sql_statements += len(statements)
+            stats.sql_seconds += timings.get("db", 0.0)
+            stats.render_seconds += timings.get("render", 0.0)
+            stats.bcrypt_seconds += timings.get("bcrypt", 0.0)
+
+        parts = [f"total;dur={total * 1000:.1f}",
+                 f'db;dur={timings.get("db", 0.0) * 1000:.1f};'
+                 f'desc="{len(statements)} statements"']
+        for name in ("render", "bcrypt"):
+            if name in timings:
+                parts.append(f"{name};dur={timings[name] * 1000:.1f}")
+        response.headers.add("Server-Timing", ", ".join(parts))
+
+        slowest = heapq.nlargest(
+            current_app.config.get("INSTRUMENTATION_SLOW_STATEMENTS", 3), statements)
+        if slowest and slowest[0][0] * 1000 >= \
+                current_app.config.get("SLOW_STATEMENT_MS", 100):
+            for seconds, statement in slowest:
+                current_app.logger.info("slow statement in %s (%.1f ms): %s",
+                                        request.endpoint, seconds * 1000, statement)
+        return response
+
+    def _dump_profile(self, profiler, total):
+        directory = current_app.config.get("PROFILE_DIR") or \
+            os.path.join(current_app.instance_path, "profiles")
+        os.makedirs(directory, exist_ok=True)
+        name = f"{request.endpoint or 'unmatched'}-" \
+            f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{total * 1000:.0f}ms.prof"
+        profiler.dump_stats(os.path.join(directory, name))
+
+    def metrics_view(self):
+        from flaskblog import cache, hasher, limiter
+
+        lines = []
+        metric = lines.append
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+            templates = sorted((name, tuple(value))
+                               for name, value in self.templates.items())
+
+        metric("# TYPE flaskblog_request_duration_seconds histogram")
+        for endpoint, stats in endpoints:
+            _histogram_lines(lines, "flaskblog_request_duration_seconds",
+                             f'endpoint="{endpoint}"', stats.duration)
+        for name, attribute in (("requests", "requests"),
+                                ("sql_statements", "sql_statements"),
+                                ("sql_seconds", "sql_seconds"),
+                                ("render_seconds", "render_seconds"),
+                                ("bcrypt_seconds", "bcrypt_seconds")):
+            metric(f"# TYPE flaskblog_{name}_total counter")
+            for endpoint, stats in endpoints:
+                metric(f'flaskblog_{name}_total{{endpoint="{endpoint}"}} '
+                       f"{getattr(stats, attribute)}")
+
+        metric("# TYPE flaskblog_template_renders_total counter")
+        metric("# TYPE flaskblog_template_render_seconds_total counter")
+        for name, (count, seconds) in templates:
+            metric(f'flaskblog_template_renders_total{{template="{name}"}} {count}')
+            metric(f'flaskblog_template_render_seconds_total{{template="{name}"}} '
+                   f"{seconds}")
+
+        metric("# TYPE flaskblog_password_hash_seconds histogram")
+        for operation, histogram in sorted(hasher.histograms.items()):
+            _histogram_lines(lines, "flaskblog_password_hash_seconds",
+                             f'operation="{operation}"', histogram)
+
+        stats = cache.stats()
+        metric("# TYPE flaskblog_response_cache_hits_total counter")
+        metric(f"flaskblog_response_cache_hits_total {stats['hits']}")
+        metric("# TYPE flaskblog_response_cache_misses_total counter")
+        metric(f"flaskblog_response_cache_misses_total {stats['misses']}")
+        metric("# TYPE flaskblog_rate_limited_total counter")
+        metric(f"flaskblog_rate_limited_total {limiter.refused}")
+        return "\n".join(lines) + "\n", 200, \
+            {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+def _histogram_lines(lines, name, labels, histogram):
+    for bound, count in histogram.cumulative():
+        le = "+Inf" if bound == float("inf") else repr(bound)
+        lines.append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+
+_sql_listeners_installed = False
+
+
+def _install_sql_listeners():
+    global _sql_listeners_installed
+    if _sql_listeners_installed:
+        return
+    _sql_listeners_installed = True
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(perf_counter())
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = perf_counter() - conn.info["query_started"].pop()
+        if has_request_context() and "sql_statements" in g:
+            g.sql_statements.append((elapsed, statement))
+            record_timing("db", elapsed)
+
+
+def _install_template_timer(app, instrumentation):
+    base = app.jinja_env.template_class
+
+    class TimedTemplate(base):
+        def render(self, *args, **kwargs):
+            start = perf_counter()
+            try:
+                return super().render(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                record_timing("render", elapsed)
+                with instrumentation._lock:
+                    totals = instrumentation.templates[self.name or "<string>"]
+                    totals[0] += 1
+                    totals[1] += elapsed
+
+    app.jinja_env.template_class = TimedTemplate
@@ -0,0 +1,185 @@
+import secrets
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from flaskblog.forking import after_fork
+
+
+class MailQueue:
+    def __init__(self, app=None):
+        self._app = None
+        self._wake = Event()
+        self._worker = None
+        self._lock = Lock()
+        after_fork(self._reset_worker)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        app.extensions["mail_queue"] = self
+        app.cli.add_command(mail_queue_cli)
+        app.before_request(self._start_worker)
+
+    def enqueue(self, msg):
+        from flaskblog import db
+        from flaskblog.models import QueuedMail
+
+        db.session.add(QueuedMail(subject=msg.subject, sender=msg.sender,
+                                  recipients=",".join(msg.recipients),
+                                  body=msg.body))
+        db.session.commit()
+        if current_app.config["MAIL_QUEUE_WORKER"]:
+            self._ensure_worker(current_app._get_current_object())
+            self._wake.set()
+
+    def _reset_worker(self):
+        self._worker = None
+        self._wake = Event()
+        self._lock = Lock()
+
+    def _start_worker(self):
+        # The first request in each process starts the worker, so mail left
+        # over from a restart or waiting out a backoff is not stranded until
+        # the next enqueue
+        if self._worker is None and current_app.config["MAIL_QUEUE_WORKER"]:
+            self._ensure_worker(current_app._get_current_object())
+
+    def _ensure_worker(self, app):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = Thread(target=self._run, args=(app,),
+                                      name="mail-queue", daemon=True)
+                self._worker.start()
+
+    def _run(self, app):
+        while True:
+            with app.app_context():
+                try:
+                    while self.flush():
+                        pass
+                except Exception:
+                    app.logger.exception("Mail queue flush failed")
+            self._wake.wait(app.config["MAIL_QUEUE_POLL_INTERVAL"])
+            self._wake.clear()
+
+    def _claim(self, batch_size):
+        from flaskblog import db
+        from flaskblog.models import QueuedMail
+
+        # A single UPDATE claims the batch, so concurrent workers never
+        # send the same message twice
+        claim = secrets.token_hex(16)
+        now = datetime.utcnow()
+        due = db.session.query(QueuedMail.id) \
+            .filter(QueuedMail.next_attempt_at <= now,
+                    QueuedMail.attempts < current_app.config["MAIL_QUEUE_MAX_ATTEMPTS"]) \
+            .order_by(QueuedMail.id).limit(batch_size)
+        QueuedMail.query.filter(QueuedMail.id.in_(due.scalar_subquery())) \
+            .update({"claim": claim, "next_attempt_at": now + timedelta(minutes=5)},
+                    synchronize_session=False)
+        db.session.commit()
+        return QueuedMail.query.filter_by(claim=claim).order_by(QueuedMail.id).all()
+
+    def _backoff(self, attempts):
+        config = current_app.config
+        delay = config["MAIL_QUEUE_BACKOFF"] * 2 ** (attempts - 1)
+        return timedelta(seconds=min(delay, config["MAIL_QUEUE_MAX_BACKOFF"]))
+
+    def _mail(self):
+        # flask_mail pulls in smtplib and the email package, so it is set up
+        # on the first send rather than at startup
+        state = current_app.extensions.get("mail")
+        if state is None:
+            from flask_mail import Mail
+
+            state = Mail(current_app._get_current_object()).state
+        return state
+
+    def flush(self, batch_size=None):
+        from flask_mail import Message
+        from flaskblog import db
+
+        batch = self._claim(batch_size or current_app.config["MAIL_QUEUE_BATCH_SIZE"])
+        if not batch:
+            return 0
+        sent = 0
+        try:
+            with self._mail().connect() as conn:
+                for queued in batch:
+                    try:
+                        conn.send(Message(queued.subject, sender=queued.sender,
+                                          recipients=queued.recipients.split(","),
+                                          body=queued.body))
+                    except Exception as exc:
+                        self._failed(queued, exc)
+                    else:
+                        db.session.delete(queued)
+                        sent += 1
+        except Exception as exc:
+            # The connection itself failed, so nothing left in the batch went out
+            for queued in batch:
+                if queued.claim is not None and queued not in db.session.deleted:
+                    self._failed(queued, exc)
+        db.session.commit()
+        return sent
+
+    def _failed(self, queued, exc):
+        queued.attempts += 1
+        queued.last_error = f"{type(exc).__name__}: {exc}"
+        queued.next_attempt_at = datetime.utcnow() + self._backoff(queued.attempts)
+        queued.claim = None
+        current_app.logger.warning("Sending mail %s failed (attempt %s): %s",
+                                   queued.id, queued.attempts, queued.last_error)
+
+
+mail_queue_cli = AppGroup("mail-queue", help="Inspect and flush queued mail.")
+
+
+@mail_queue_cli.command("status")
+@click.option("--limit", default=20, show_default=True,
+              help="Number of queued messages to list.")
+@with_appcontext
+def status_command(limit):
+    from flaskblog.models import QueuedMail
+
+    max_attempts = current_app.config["MAIL_QUEUE_MAX_ATTEMPTS"]
+    now = datetime.utcnow()
+    pending = QueuedMail.query.filter(QueuedMail.attempts < max_attempts)
+    click.echo(f"pending: {pending.count()}  "
+               f"due: {pending.filter(QueuedMail.next_attempt_at <= now).count()}  "
+               f"dead: {QueuedMail.query.filter(QueuedMail.attempts >= max_attempts).count()}")
+    for queued in QueuedMail.query.order_by(QueuedMail.id).limit(limit):
+        click.echo(f"{queued.id:>6}  {queued.recipients:<30}  attempts={queued.attempts}  "
+                   f"next={queued.next_attempt_at:%Y-%m-%d %H:%M:%S}  "
+                   f"{queued.last_error or ''}")
+
+
+@mail_queue_cli.command("flush")
+@click.option("--retry-dead", is_flag=True,
+              help="Reset messages that ran out of attempts before flushing.")
+@click.option("--now", "ignore_backoff", is_flag=True,
+              help="Send messages that are still backing off.")
+@with_appcontext
+def flush_command(retry_dead, ignore_backoff):
+    from flaskblog import db
+    from flaskblog.models import QueuedMail
+
+    if retry_dead:
+        QueuedMail.query.filter(
+            QueuedMail.attempts >= current_app.config["MAIL_QUEUE_MAX_ATTEMPTS"]) \
+            .update({"attempts": 0}, synchronize_session=False)
+    if ignore_backoff:
+        QueuedMail.query.update({"next_attempt_at": datetime.utcnow()},
+                                synchronize_session=False)
+    db.session.commit()
+    queue = current_app.extensions["mail_queue"]
+    total = 0
+    while True:
+        sent = queue.flush()
+        total += sent
+        if not sent:
+            break
+    click.echo(f"Sent {total} message(s).")
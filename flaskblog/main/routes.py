@@ -1,5 +1,9 @@
-from flask import render_template, request, Blueprint
+from flask import render_template, Blueprint
+from flaskblog import cache
+from flaskblog.conditional import feed_validators, not_modified, with_validators
 from flaskblog.models import Post
+from flaskblog.pagination import paginate_posts
+from flaskblog.queries import query_budget, with_authors
 
 main = Blueprint("main", __name__)
 
@@ -7,11 +11,13 @@ main = Blueprint("main", __name__)
 @main.route('/')
 @main.route('/index')
 @main.route('/home')
+@cache.cached_page("home")
+@query_budget(4)
 def home():
-    page = request.args.get("page", 1, type=int)
-    posts = Post.query.order_by(
-        Post.date_posted.desc()).paginate(page=page, per_page=5)
-    return render_template("home.html", posts=posts)
+    posts = paginate_posts(with_authors(Post.query), "home")
+    etag, last_modified = feed_validators(posts, getattr(posts, "pages", None))
+    return not_modified(etag, last_modified) or with_validators(
+        render_template("home.html", posts=posts), etag, last_modified)
 
 
 @main.route("/about")
@@ -0,0 +1,36 @@
+from bisect import bisect_left
+from threading import Lock
+from flask import g, has_request_context
+
+
+# Upper bounds in seconds, Prometheus style
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def cumulative(self):
+        with self._lock:
+            counts = list(self.counts)
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            total += count
+            yield bound, total
+
+
+def record_timing(name: str, seconds: float):
+    # Per-request timings are only collected while instrumentation is on
+    if has_request_context() and "timings" in g:
+        g.timings[name] = g.timings.get(name, 0.0) + seconds
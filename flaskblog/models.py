@@ -4,11 +4,47 @@ from flask import current_app
 from datetime import datetime
 from flaskblog import login_manager
 from flask_login import UserMixin
+from sqlalchemy import DDL, event
+from sqlalchemy.orm import make_transient_to_detached
+from flaskblog.cache import MemoryCache
+
+
+# Only non-secret identity columns are cached. The password hash and any
+# other column stay unloaded on cached users and are read from the database
+# on first access.
+IDENTITY_FIELDS = ("id", "username", "email", "img_file")
+
+
+def init_identity_cache(app):
+    # One cache per app, so apps on different databases in the same process
+    # never see each other's users
+    app.extensions["identity_cache"] = MemoryCache(
+        max_entries=app.config.get("USER_CACHE_SIZE", 1000))
+
+
+def _identity_cache():
+    return current_app.extensions["identity_cache"]
+
+
+def invalidate_user_identity(user_id: int):
+    _identity_cache().delete(int(user_id))
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))    
+    user_id = int(user_id)
+    identity = _identity_cache().get(user_id)
+    if identity is None:
+        user = User.query.get(user_id)
+        if user is not None:
+            _identity_cache().set(user_id, {field: getattr(user, field)
+                                         for field in IDENTITY_FIELDS},
+                               current_app.config.get("USER_CACHE_TTL", 30))
+        return user
+    user = User(**identity)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -16,6 +52,8 @@ class User(db.Model, UserMixin):
     email = db.Column(db.String(120), unique=True, nullable=False)
     img_file = db.Column(db.String(20), nullable=False, default="default.jpg")
     password = db.Column(db.String(60), nullable=False)
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    last_posted_at = db.Column(db.DateTime)
     posts = db.relationship("Post", backref="author", lazy=True)
 
     def __repr__(self):
@@ -35,12 +73,86 @@ class User(db.Model, UserMixin):
         return User.query.get(user_id)
 
 class Post(db.Model):
+    __table_args__ = (
+        db.Index("ix_post_date_posted_id", "date_posted", "id"),
+        db.Index("ix_post_user_id_date_posted_id", "user_id", "date_posted", "id"),
+        db.Index("ix_post_updated_at_id", "updated_at", "id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     date_posted = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Databases that predate this column add it with
+    #   ALTER TABLE post ADD COLUMN updated_at DATETIME;
+    #   UPDATE post SET updated_at = date_posted;
+    # SQLite cannot add it as NOT NULL with a default, so rows that were
+    # not backfilled read as NULL and fall back to date_posted
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow,
+                           onupdate=datetime.utcnow)
     content = db.Column(db.Text, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+
+    @property
+    def last_modified(self):
+        return self.updated_at or self.date_posted
     
     def __repr__(self):
         return f"User ('{self.title}', '{self.date_posted}')"
-    
+
+
+class LatestPost(db.Model):
+    post_id = db.Column(db.Integer, db.ForeignKey("post.id", ondelete="CASCADE"),
+                        primary_key=True)
+    title = db.Column(db.String(100), nullable=False)
+    date_posted = db.Column(db.DateTime, nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+
+    def __repr__(self):
+        return f"LatestPost ('{self.title}', '{self.date_posted}')"
+
+
+# Full-text index over posts, an external-content FTS5 table kept in sync by
+# triggers so every write path (ORM, Core, raw SQL) updates it
+POST_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5("
+    "title, content, content='post', content_rowid='id', "
+    "tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS post_fts_ai AFTER INSERT ON post BEGIN "
+    "INSERT INTO post_fts(rowid, title, content) "
+    "VALUES (new.id, new.title, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS post_fts_ad AFTER DELETE ON post BEGIN "
+    "INSERT INTO post_fts(post_fts, rowid, title, content) "
+    "VALUES ('delete', old.id, old.title, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS post_fts_au AFTER UPDATE OF title, content "
+    "ON post BEGIN "
+    "INSERT INTO post_fts(post_fts, rowid, title, content) "
+    "VALUES ('delete', old.id, old.title, old.content); "
+    "INSERT INTO post_fts(rowid, title, content) "
+    "VALUES (new.id, new.title, new.content); END",
+)
+
+for statement in POST_FTS_DDL:
+    event.listen(Post.__table__, "after_create",
+                 DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Post.__table__, "after_drop",
+             DDL("DROP TABLE IF EXISTS post_fts").execute_if(dialect="sqlite"))
+
+
+class QueuedMail(db.Model):
+    __table_args__ = (
+        db.Index("ix_queued_mail_next_attempt_at", "next_attempt_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(255), nullable=False)
+    sender = db.Column(db.String(120), nullable=False)
+    recipients = db.Column(db.Text, nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    claim = db.Column(db.String(32))
+
+    def __repr__(self):
+        return f"QueuedMail ('{self.subject}', '{self.recipients}', {self.attempts})"
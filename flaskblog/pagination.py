@@ -0,0 +1,106 @@
+from datetime import datetime
+from time import monotonic
+from flask import current_app, request, abort
+from itsdangerous import URLSafeSerializer, BadSignature
+from sqlalchemy import tuple_
+from flaskblog.models import Post
+
+
+# Approximate totals keyed by feed, so cursor pages never pay for COUNT(*)
+_count_cache = {}
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config["SECRET_KEY"], salt="feed-cursor")
+
+
+def encode_cursor(post: Post, direction: str):
+    return _serializer().dumps(
+        [post.date_posted.isoformat(), post.id, direction])
+
+
+def decode_cursor(token: str):
+    try:
+        date_posted, post_id, direction = _serializer().loads(token)
+        if direction not in ("next", "prev"):
+            return None
+        return datetime.fromisoformat(date_posted), int(post_id), direction
+    except (BadSignature, ValueError, TypeError):
+        return None
+
+
+def approximate_count(query, key):
+    now = monotonic()
+    cached = _count_cache.get(key)
+    if cached and cached[1] > now:
+        return cached[0]
+    total = query.order_by(None).count()
+    ttl = current_app.config.get("FEED_COUNT_TTL", 60)
+    _count_cache[key] = (total, now + ttl)
+    return total
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor, prev_cursor, count):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self._count = count
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def total(self):
+        return self._count()
+
+
+def keyset_paginate(query, cursor=None, per_page=5, count_key=None, count=None):
+    keys = tuple_(Post.date_posted, Post.id)
+    newest_first = (Post.date_posted.desc(), Post.id.desc())
+    position = decode_cursor(cursor) if cursor else None
+    if cursor and position is None:
+        abort(404)
+
+    if position is None:
+        rows = query.order_by(*newest_first).limit(per_page + 1).all()
+        direction = None
+    else:
+        date_posted, post_id, direction = position
+        if direction == "next":
+            rows = query.filter(keys < tuple_(date_posted, post_id)) \
+                .order_by(*newest_first).limit(per_page + 1).all()
+        else:
+            rows = query.filter(keys > tuple_(date_posted, post_id)) \
+                .order_by(Post.date_posted, Post.id).limit(per_page + 1).all()
+
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+    if direction == "prev":
+        items.reverse()
+
+    next_cursor = prev_cursor = None
+    if items:
+        if has_more or direction == "prev":
+            next_cursor = encode_cursor(items[-1], "next")
+        if direction == "next" or (direction == "prev" and has_more):
+            prev_cursor = encode_cursor(items[0], "prev")
+
+    if count is None:
+        count = lambda: approximate_count(query, count_key or str(query))
+    return KeysetPage(items, next_cursor, prev_cursor, count)
+
+
+def paginate_posts(query, count_key, per_page=5, count=None):
+    # Legacy ?page=N links keep using OFFSET pagination
+    page = request.args.get("page", type=int)
+    if page is not None:
+        return query.order_by(Post.date_posted.desc(), Post.id.desc()) \
+            .paginate(page=page, per_page=per_page)
+    return keyset_paginate(query, request.args.get("cursor"),
+                           per_page=per_page, count_key=count_key, count=count)
@@ -1,10 +1,22 @@
+import click
 from flask_login import login_required, current_user
-from flaskblog import db
+from flaskblog import cache, db
 from flask import render_template, url_for, flash, redirect, request, abort, Blueprint
 from flaskblog.posts.forms import PostForm
+from flaskblog.posts.utils import (POST_EXPORT_FIELDS, author_username,
+                                   check_post_stats, export_posts, import_posts,
+                                   latest_posts, post_namespaces,
+                                   record_post_created, record_post_deleted,
+                                   record_post_updated)
+from flaskblog.bulk import (FORMATS, Progress, guess_format, open_stream, read_rows,
+                            write_rows)
 from flaskblog.models import Post
+from flaskblog.conditional import (make_etag, not_modified, page_last_modified,
+                                   post_version, with_validators)
+from flaskblog.queries import query_budget, with_authors
 
 posts = Blueprint("posts", __name__)
+posts.add_app_template_global(latest_posts)
 
 
 @posts.route("/post/new", methods=["GET", "POST"])
@@ -15,7 +27,9 @@ def new_post():
         post = Post(title=form.title.data, content=form.content.data,
                     author=current_user)
         db.session.add(post)
+        record_post_created(post)
         db.session.commit()
+        cache.invalidate("home", "latest", f"user:{author_username(post.user_id)}")
         flash("New post uploaded successfully!", "success")
         return redirect(url_for("main.home"))
     return render_template("create_post.html", title="New Post", form=form,
@@ -23,9 +37,15 @@ def new_post():
 
 
 @posts.route("/post/<post_id>")
+@cache.cached_page("post:{post_id}", related=post_namespaces)
+@query_budget(3)
 def post(post_id: int):
-    post = Post.query.get_or_404(post_id)
-    return render_template("post.html", title=post.title, post=post)
+    post = with_authors(Post.query).get_or_404(post_id)
+    etag = make_etag(post_version(post))
+    last_modified = page_last_modified(post.last_modified, f"author:{post.user_id}")
+    return not_modified(etag, last_modified) or with_validators(
+        render_template("post.html", title=post.title, post=post),
+        etag, last_modified)
 
 
 @posts.route("/post/<int:post_id>/update", methods=["POST", "GET"])
@@ -38,7 +58,10 @@ def update_post(post_id: int):
     if form.validate_on_submit():
         post.title = form.title.data
         post.content = form.content.data
+        latest_changed = record_post_updated(post)
         db.session.commit()
+        cache.invalidate("home", f"user:{author_username(post.user_id)}",
+                         f"post:{post.id}", *(["latest"] if latest_changed else []))
         flash("Post updated successfully!", "success")
         return redirect(url_for("posts.post", post_id=post.id))
     elif request.method == "GET":
@@ -54,7 +77,61 @@ def delete_post(post_id: int):
     post = Post.query.get_or_404(post_id)
     if post.author != current_user:
         abort(403)
+    user_id = post.user_id
     db.session.delete(post)
+    latest_changed = record_post_deleted(post)
     db.session.commit()
+    cache.invalidate("home", f"user:{author_username(user_id)}", f"post:{post_id}",
+                     *(["latest"] if latest_changed else []))
     flash("Your post has been deleted!!", "success")
     return redirect(url_for("main.home"))
+
+
+@posts.cli.command("check-stats")
+@click.option("--repair", is_flag=True, help="Rewrite stale counters.")
+def check_stats_command(repair):
+    problems = check_post_stats(repair=repair)
+    for problem in problems:
+        click.echo(problem)
+    if not problems:
+        click.echo("Post statistics are consistent.")
+    elif repair:
+        click.echo(f"Repaired {len(problems)} problem(s).")
+    else:
+        raise SystemExit(1)
+
+
+@posts.cli.command("import",
+                   help="Import posts, skipping rows whose author does not exist.")
+@click.argument("path")
+@click.option("--format", "fmt", type=click.Choice(FORMATS),
+              help="Defaults to the file extension, or jsonl.")
+@click.option("--batch-size", default=1000, show_default=True,
+              help="Rows per INSERT.")
+@click.option("--commit-every", default=50_000, show_default=True,
+              help="Rows per transaction.")
+def import_command(path, fmt, batch_size, commit_every):
+    progress = Progress("posts")
+    with open_stream(path, "r") as stream:
+        try:
+            import_posts(read_rows(stream, guess_format(path, fmt)), progress,
+                         batch_size, commit_every)
+        except ValueError as exc:
+            db.session.rollback()
+            raise click.ClickException(str(exc))
+    progress.done()
+
+
+@posts.cli.command("export",
+                   help="Export posts with their author's username.")
+@click.argument("path", default="-")
+@click.option("--format", "fmt", type=click.Choice(FORMATS),
+              help="Defaults to the file extension, or jsonl.")
+@click.option("--batch-size", default=1000, show_default=True,
+              help="Rows fetched per round trip.")
+def export_command(path, fmt, batch_size):
+    progress = Progress("posts")
+    with open_stream(path, "w") as stream:
+        write_rows(stream, guess_format(path, fmt), POST_EXPORT_FIELDS,
+                   export_posts(batch_size), progress)
+    progress.done()
@@ -0,0 +1,189 @@
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import case, func, insert, or_, select
+from flaskblog import cache, db
+from flaskblog.bulk import chunked, parse_datetime
+from flaskblog.models import LatestPost, Post, User
+
+
+def _latest_size():
+    return current_app.config.get("LATEST_POSTS_SIZE", 5)
+
+
+def _newest_first(model, id_column):
+    return model.date_posted.desc(), id_column.desc()
+
+
+def refresh_latest_posts():
+    LatestPost.query.delete(synchronize_session=False)
+    newest = db.session.query(Post.id, Post.title, Post.date_posted, Post.user_id) \
+        .order_by(*_newest_first(Post, Post.id)).limit(_latest_size())
+    db.session.execute(insert(LatestPost).from_select(
+        ["post_id", "title", "date_posted", "user_id"], newest))
+
+
+def _trim_latest_posts():
+    keep = db.session.query(LatestPost.post_id) \
+        .order_by(*_newest_first(LatestPost, LatestPost.post_id)) \
+        .limit(_latest_size())
+    LatestPost.query.filter(LatestPost.post_id.notin_(keep.scalar_subquery())) \
+        .delete(synchronize_session=False)
+
+
+def _refresh_last_posted(user_id: int):
+    newest = db.session.query(func.max(Post.date_posted)) \
+        .filter(Post.user_id == user_id).scalar_subquery()
+    User.query.filter_by(id=user_id) \
+        .update({"last_posted_at": newest}, synchronize_session=False)
+
+
+# These run inside the caller's transaction, before it commits, so the
+# counters can never disagree with the post table
+
+def record_post_created(post: Post):
+    db.session.flush()
+    User.query.filter_by(id=post.user_id).update({
+        "post_count": User.post_count + 1,
+        "last_posted_at": case(
+            (or_(User.last_posted_at.is_(None),
+                 User.last_posted_at < post.date_posted), post.date_posted),
+            else_=User.last_posted_at),
+    }, synchronize_session=False)
+    db.session.add(LatestPost(post_id=post.id, title=post.title,
+                              date_posted=post.date_posted, user_id=post.user_id))
+    db.session.flush()
+    _trim_latest_posts()
+
+
+def record_post_updated(post: Post):
+    # Returns whether the latest posts sidebar changed
+    return LatestPost.query.filter_by(post_id=post.id) \
+        .filter(LatestPost.title != post.title) \
+        .update({"title": post.title}, synchronize_session=False) > 0
+
+
+def record_post_deleted(post: Post):
+    # Look before flushing, a foreign key cascade may remove the row first
+    with db.session.no_autoflush:
+        was_latest = db.session.query(LatestPost.post_id) \
+            .filter_by(post_id=post.id).first() is not None
+    db.session.flush()
+    User.query.filter_by(id=post.user_id) \
+        .update({"post_count": User.post_count - 1}, synchronize_session=False)
+    _refresh_last_posted(post.user_id)
+    if was_latest:
+        refresh_latest_posts()
+    return was_latest
+
+
+def author_username(user_id: int):
+    # Read from the database, the username on current_user may come from the
+    # identity cache and predate a rename in another worker
+    return db.session.query(User.username).filter_by(id=user_id).scalar()
+
+
+def post_namespaces(post_id):
+    # A post never changes author, so the lookup is cached with the post
+    author_id = cache.cached_fragment(
+        f"post:{post_id}", "author",
+        lambda: db.session.query(Post.user_id).filter_by(id=post_id).scalar())
+    return (f"author:{author_id}",) if author_id is not None else ()
+
+
+def _load_latest_posts():
+    rows = db.session.query(LatestPost.post_id, LatestPost.title, User.username) \
+        .join(User, User.id == LatestPost.user_id) \
+        .order_by(*_newest_first(LatestPost, LatestPost.post_id))
+    return [tuple(row) for row in rows]
+
+
+def latest_posts():
+    return cache.cached_fragment("latest", "latest-posts", _load_latest_posts)
+
+
+def check_post_stats(repair=False):
+    problems = []
+    actual = {user_id: (count, last_posted) for user_id, count, last_posted in
+              db.session.query(Post.user_id, func.count(Post.id),
+                               func.max(Post.date_posted)).group_by(Post.user_id)}
+    users = db.session.query(User.id, User.username, User.post_count,
+                             User.last_posted_at).all()
+    for user_id, username, post_count, last_posted_at in users:
+        expected = actual.get(user_id, (0, None))
+        if (post_count, last_posted_at) != expected:
+            problems.append(f"user {username}: stored {post_count}, "
+                            f"{last_posted_at}; actual {expected[0]}, {expected[1]}")
+            if repair:
+                User.query.filter_by(id=user_id).update(
+                    {"post_count": expected[0], "last_posted_at": expected[1]},
+                    synchronize_session=False)
+
+    latest_stale = False
+    expected = db.session.query(Post.id, Post.title) \
+        .order_by(*_newest_first(Post, Post.id)).limit(_latest_size()).all()
+    stored = db.session.query(LatestPost.post_id, LatestPost.title) \
+        .order_by(*_newest_first(LatestPost, LatestPost.post_id)).all()
+    if [tuple(row) for row in stored] != [tuple(row) for row in expected]:
+        problems.append("latest posts table is out of date")
+        latest_stale = True
+        if repair:
+            refresh_latest_posts()
+
+    if repair and problems:
+        db.session.commit()
+        cache.invalidate("home", *(["latest"] if latest_stale else []))
+    return problems
+
+
+POST_EXPORT_FIELDS = ("title", "content", "date_posted", "updated_at", "author")
+
+
+def import_posts(rows, progress, batch_size=1000, commit_every=50_000):
+    authors, pending = set(), set()
+    uncommitted = 0
+    now = datetime.utcnow()
+    try:
+        for chunk in chunked(rows, batch_size):
+            user_ids = dict(db.session.query(User.username, User.id).filter(
+                User.username.in_({row.get("author") for row in chunk})))
+            values = []
+            for number, row in enumerate(chunk, progress.count + progress.skipped + 1):
+                if not row.get("title") or not row.get("content"):
+                    raise ValueError(f"row {number}: title and content are required")
+                if row.get("author") not in user_ids:
+                    continue
+                try:
+                    date_posted = parse_datetime(row.get("date_posted"), now)
+                    updated_at = parse_datetime(row.get("updated_at"), date_posted)
+                except (TypeError, ValueError) as exc:
+                    raise ValueError(f"row {number}: {exc}") from exc
+                values.append({"title": row["title"], "content": row["content"],
+                               "date_posted": date_posted, "updated_at": updated_at,
+                               "user_id": user_ids[row["author"]]})
+                pending.add(row["author"])
+            if values:
+                # The FTS triggers index each row as part of the same insert
+                db.session.execute(Post.__table__.insert(), values)
+            uncommitted += len(values)
+            if uncommitted >= commit_every:
+                db.session.commit()
+                authors |= pending
+                uncommitted = 0
+            progress.update(len(values), skipped=len(chunk) - len(values))
+        db.session.commit()
+        authors |= pending
+    finally:
+        # Even when a later row fails, the chunks already committed must not
+        # leave the counters, latest posts or cached pages behind
+        if authors:
+            db.session.rollback()
+            check_post_stats(repair=True)
+            cache.invalidate("home", *(f"user:{username}" for username in authors))
+
+
+def export_posts(batch_size=1000):
+    query = select(Post.title, Post.content, Post.date_posted, Post.updated_at,
+                   User.username) \
+        .join(User, User.id == Post.user_id) \
+        .order_by(Post.id).execution_options(yield_per=batch_size)
+    return db.session.execute(query)
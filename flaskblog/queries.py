@@ -0,0 +1,51 @@
+from functools import wraps
+from flask import current_app, g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import joinedload
+from flaskblog.models import Post, User
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def with_authors(query):
+    # List views only render the author's name and avatar
+    return query.options(
+        joinedload(Post.author).load_only(User.username, User.img_file))
+
+
+def query_budget(limit: int):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            g.query_budget = limit
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def query_count():
+    return g.get("query_count", 0)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count = g.get("query_count", 0) + 1
+
+
+def _check_budget(response):
+    limit = g.get("query_budget", current_app.config.get("QUERY_BUDGET"))
+    count = query_count()
+    if limit is not None and count > limit:
+        message = f"{count} queries issued, budget is {limit}"
+        if current_app.config.get("QUERY_BUDGET_RAISE", current_app.testing):
+            raise QueryBudgetExceeded(message)
+        current_app.logger.warning(message)
+    return response
+
+
+def init_query_counter(app):
+    app.after_request(_check_budget)
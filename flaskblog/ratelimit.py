@@ -0,0 +1,163 @@
+import os
+import sqlite3
+from collections import OrderedDict
+from functools import wraps
+from math import ceil
+from threading import Lock, local
+from time import time
+from flask import current_app, request
+from werkzeug.exceptions import TooManyRequests
+from flaskblog.forking import after_fork
+
+
+class RateLimited(TooManyRequests):
+    description = "Too many attempts. Please wait a moment and try again."
+
+
+# Every backend keeps one (tokens, updated) bucket per key and refills it
+# lazily on the next take, so a check is a single lookup and write
+
+class NullBuckets:
+    def take(self, key, rate, capacity, now, cost=1):
+        return 0
+
+
+class MemoryBuckets:
+    def __init__(self, max_entries=10_000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = Lock()
+
+    def take(self, key, rate, capacity, now, cost=1):
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens < cost:
+                return (cost - tokens) / rate
+            self._buckets[key] = (tokens - cost, now)
+            self._buckets.move_to_end(key)
+            # An evicted key starts over with a full bucket
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+            return 0
+
+
+class SQLiteBuckets:
+    TAKE = """
+        INSERT INTO rate_bucket (key, tokens, updated)
+        VALUES (:key, :capacity - :cost, :now)
+        ON CONFLICT (key) DO UPDATE
+        SET tokens = min(:capacity, tokens + (:now - updated) * :rate) - :cost,
+            updated = :now
+        WHERE min(:capacity, tokens + (:now - updated) * :rate) >= :cost
+        RETURNING tokens
+    """
+
+    def __init__(self, path, prune_every=1000, max_age=86400):
+        # TAKE relies on upsert with RETURNING
+        if sqlite3.sqlite_version_info < (3, 35, 0):
+            raise RuntimeError(
+                f"RATELIMIT_STORAGE 'sqlite' needs SQLite 3.35 or newer, "
+                f"this Python links {sqlite3.sqlite_version}. "
+                "Use RATELIMIT_STORAGE 'memory' instead")
+        self.path = path
+        self.prune_every = prune_every
+        self.max_age = max_age
+        self._local = local()
+        after_fork(self._reset_connections)
+        self._takes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS rate_bucket "
+                         "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+                         "updated REAL NOT NULL) WITHOUT ROWID")
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Losing the last few buckets in a crash only forgives a few attempts
+        conn.execute("PRAGMA synchronous=OFF")
+        return conn
+
+    def _reset_connections(self):
+        self._local = local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def take(self, key, rate, capacity, now, cost=1):
+        conn = self._connection()
+        self._takes += 1
+        if self._takes % self.prune_every == 0:
+            conn.execute("DELETE FROM rate_bucket WHERE updated < ?",
+                         (now - self.max_age,))
+        params = {"key": key, "rate": rate, "capacity": capacity,
+                  "now": now, "cost": cost}
+        if conn.execute(self.TAKE, params).fetchone() is not None:
+            return 0
+        # Only a refused take needs the second statement
+        row = conn.execute("SELECT tokens, updated FROM rate_bucket WHERE key = ?",
+                           (key,)).fetchone()
+        if row is None:
+            return 0
+        tokens, updated = row
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        return max(cost - tokens, 0) / rate
+
+
+def remote_address():
+    # Behind a proxy, wrap the app in werkzeug's ProxyFix so this is the client
+    return request.remote_addr
+
+
+def account_email():
+    return request.form.get("email", "").strip().lower() or None
+
+
+class RateLimiter:
+    def __init__(self, app=None):
+        self.backend = NullBuckets()
+        self.refused = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        storage = app.config.get("RATELIMIT_STORAGE", "memory")
+        if storage == "memory":
+            self.backend = MemoryBuckets(app.config.get("RATELIMIT_MAX_KEYS", 10_000))
+        elif storage == "sqlite":
+            path = app.config.get("RATELIMIT_SQLITE_PATH") or \
+                os.path.join(app.instance_path, "ratelimit.db")
+            self.backend = SQLiteBuckets(path)
+        elif storage == "null":
+            self.backend = NullBuckets()
+        else:
+            raise ValueError(f"Unknown RATELIMIT_STORAGE '{storage}'")
+        app.extensions["rate_limiter"] = self
+
+    def hit(self, name, key, capacity: int, per: float, cost=1):
+        wait = self.backend.take(f"{name}:{key}", capacity / per, capacity, time(), cost)
+        if wait:
+            self.refused += 1
+            raise RateLimited(retry_after=max(1, ceil(wait)))
+
+    def limit(self, name, capacity: int, per: float, key=remote_address,
+              methods=("POST",)):
+        # Allows bursts of `capacity` requests, refilled evenly over `per` seconds
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method in methods \
+                        and current_app.config.get("RATELIMIT_ENABLED", True):
+                    value = key()
+                    if value:
+                        self.hit(name, value, capacity, per)
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
@@ -0,0 +1,25 @@
+from time import perf_counter
+import click
+from flask import render_template, request, Blueprint
+from flaskblog.search.utils import optimize_index, rebuild_index, search_posts
+
+search = Blueprint("search", __name__)
+
+
+@search.route("/search")
+def search_results():
+    query = request.args.get("q", "").strip()
+    results = search_posts(query, request.args.get("cursor"))
+    return render_template("search.html", title="Search", query=query,
+                           results=results)
+
+
+@search.cli.command("reindex")
+@click.option("--optimize", is_flag=True,
+              help="Merge the index segments after rebuilding.")
+def reindex_command(optimize):
+    start = perf_counter()
+    rebuild_index()
+    if optimize:
+        optimize_index()
+    click.echo(f"Rebuilt the post search index in {perf_counter() - start:.2f}s.")
@@ -0,0 +1,108 @@
+import re
+import secrets
+from collections import namedtuple
+from flask import current_app, abort
+from itsdangerous import URLSafeSerializer, BadSignature
+from markupsafe import Markup, escape
+from sqlalchemy import text
+from flaskblog import db
+from flaskblog.models import POST_FTS_DDL, Post
+from flaskblog.pagination import KeysetPage
+from flaskblog.queries import with_authors
+
+
+SearchResult = namedtuple("SearchResult", "post title snippet")
+
+# bm25 column weights for (title, content)
+_WEIGHTS = "10.0, 1.0"
+
+_SEARCH_SQL = f"""
+SELECT id, rank, title, snippet FROM (
+    SELECT rowid AS id, bm25(post_fts, {_WEIGHTS}) AS rank,
+           highlight(post_fts, 0, :open, :close) AS title,
+           snippet(post_fts, 1, :open, :close, '…', 32) AS snippet
+    FROM post_fts WHERE post_fts MATCH :match
+)
+WHERE :rank IS NULL OR rank > :rank OR (rank = :rank AND id > :id)
+ORDER BY rank, id
+LIMIT :limit
+"""
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config["SECRET_KEY"], salt="search-cursor")
+
+
+def to_match_expression(query: str):
+    # Quote every term so user input can never be parsed as FTS5 syntax, and
+    # let the last term match as a prefix for search-as-you-type
+    terms = re.findall(r"\w+", query)
+    if not terms:
+        return None
+    quoted = ['"' + term + '"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _markers():
+    # Titles and content are user input and may hold any character, so the
+    # highlight boundaries carry a fresh random token no post can contain.
+    # Escaping leaves them intact until they are swapped for tags
+    token = secrets.token_hex(8)
+    return f"\x02{token}\x02", f"\x03{token}\x03"
+
+
+def _highlighted(value: str, markers):
+    open_, close = markers
+    return Markup(str(escape(value)).replace(open_, "<mark>")
+                  .replace(close, "</mark>"))
+
+
+def count_matches(match: str):
+    return db.session.execute(
+        text("SELECT count(*) FROM post_fts WHERE post_fts MATCH :match"),
+        {"match": match}).scalar()
+
+
+def search_posts(query: str, cursor=None, per_page=10):
+    match = to_match_expression(query)
+    if match is None:
+        return KeysetPage([], None, None, lambda: 0)
+    rank = post_id = None
+    if cursor:
+        try:
+            rank, post_id = _serializer().loads(cursor)
+        except (BadSignature, ValueError, TypeError):
+            abort(404)
+
+    markers = _markers()
+    rows = db.session.execute(text(_SEARCH_SQL), {
+        "match": match, "open": markers[0], "close": markers[1],
+        "rank": rank, "id": post_id, "limit": per_page + 1}).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    posts = {post.id: post for post in
+             with_authors(Post.query).filter(Post.id.in_([row.id for row in rows]))}
+    items = [SearchResult(posts[row.id], _highlighted(row.title, markers),
+                          _highlighted(row.snippet, markers))
+             for row in rows if row.id in posts]
+    next_cursor = _serializer().dumps([rows[-1].rank, rows[-1].id]) \
+        if has_more else None
+    return KeysetPage(items, next_cursor, None, lambda: count_matches(match))
+
+
+def ensure_index():
+    for statement in POST_FTS_DDL:
+        db.session.execute(text(statement))
+    db.session.commit()
+
+
+def rebuild_index():
+    ensure_index()
+    db.session.execute(text("INSERT INTO post_fts(post_fts) VALUES ('rebuild')"))
+    db.session.commit()
+
+
+def optimize_index():
+    db.session.execute(text("INSERT INTO post_fts(post_fts) VALUES ('optimize')"))
+    db.session.commit()
@@ -4,6 +4,8 @@ from flask_wtf.file import FileField, FileAllowed
 from wtforms import (StringField, BooleanField, PasswordField, SubmitField,
                      ValidationError)
 from wtforms.validators import DataRequired, EqualTo, Length, Email
+from sqlalchemy import or_
+from flaskblog import db
 from flaskblog.models import User
 
 
@@ -16,15 +18,22 @@ class RegistrationForm(FlaskForm):
                                      validators=[DataRequired(), EqualTo('password')])
     submit = SubmitField('Sign Up')
 
+    def _taken(self):
+        # One lookup answers both uniqueness checks
+        if not hasattr(self, "_taken_values"):
+            rows = db.session.query(User.username, User.email).filter(or_(
+                User.username == self.username.data,
+                User.email == self.email.data))
+            self._taken_values = {value for row in rows for value in row}
+        return self._taken_values
+
     def validate_username(self, username):
-        user = User.query.filter_by(username=username.data).first()
-        if user:
+        if username.data in self._taken():
             raise ValidationError(
                 "That username already exists. Please choose another")
 
     def validate_email(self, email):
-        user = User.query.filter_by(email=email.data).first()
-        if user:
+        if email.data in self._taken():
             raise ValidationError(
                 "That email already exists. Please choose another")
 
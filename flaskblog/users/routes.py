@@ -1,24 +1,39 @@
 from flask_login import login_required, login_user, current_user, logout_user
-from flaskblog import bcrypt, db
-from flask import render_template, url_for, flash, redirect, request, Blueprint
+from flaskblog import cache, db, hasher, limiter
+import click
+from flask import (render_template, url_for, flash, redirect, request, Blueprint,
+                   send_from_directory)
 from flaskblog.users.forms import (ChangePasswordForm, RegistrationForm,
                                    LoginForm, ResetPassword, UpdateAccountForm,
                                    RequestResetForm)
-from flaskblog.users.utils import save_picture, send_reset_email
-from flaskblog.models import Post, User
+from flaskblog.users.utils import (USER_EXPORT_FIELDS, avatar_dir, avatar_srcset,
+                                   avatar_url, collect_orphans, export_users,
+                                   import_users, invalidate_user_pages,
+                                   is_hashed_avatar, save_picture,
+                                   send_reset_email)
+from flaskblog.bulk import (FORMATS, Progress, guess_format, open_stream, read_rows,
+                            write_rows)
+from flaskblog.models import Post, User, invalidate_user_identity
+from flaskblog.conditional import feed_validators, not_modified, with_validators
+from flaskblog.pagination import paginate_posts
+from flaskblog.queries import query_budget, with_authors
+from flaskblog.ratelimit import account_email
 
 
 users = Blueprint("users", __name__)
+users.add_app_template_global(avatar_url)
+users.add_app_template_global(avatar_srcset)
+users.add_app_template_global(is_hashed_avatar)
 
 
 @users.route("/register", methods=["GET", "POST"])
+@limiter.limit("register-ip", 5, 600)
 def register():
     if current_user.is_authenticated:
         return redirect(url_for("main.home"))
     form = RegistrationForm()
     if form.validate_on_submit():
-        hashed_pw = bcrypt.generate_password_hash(
-            form.password.data).decode("utf-8")
+        hashed_pw = hasher.generate_password_hash(form.password.data)
         uname = form.username.data
         email = form.email.data
         user = User(username=uname, password=hashed_pw, email=email)
@@ -30,13 +45,18 @@ def register():
 
 
 @users.route("/login", methods=["GET", "POST"])
+@limiter.limit("login-ip", 20, 60)
+@limiter.limit("login-account", 5, 300, key=account_email)
 def login():
     if current_user.is_authenticated:
         return redirect(url_for("main.home"))
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
-        if user and bcrypt.check_password_hash(user.password, form.password.data):
+        if user and hasher.check_password_hash(user.password, form.password.data):
+            if hasher.needs_rehash(user.password):
+                user.password = hasher.generate_password_hash(form.password.data)
+                db.session.commit()
             login_user(user, remember=form.remember.data)
             next_page = request.args.get("next")
             flash(f"Welcome {current_user.username}!", "success")
@@ -57,11 +77,21 @@ def account():
     form = UpdateAccountForm()
     pw_form = ChangePasswordForm()
     if form.validate_on_submit():
-        if form.picture.data:
-            current_user.img_file = save_picture(form.picture.data)
+        old_username = current_user.username
         current_user.username = form.username.data
         current_user.email = form.email.data
         db.session.commit()
+        invalidate_user_identity(current_user.id)
+        # The email is on no cached page, only a rename needs them rebuilt
+        if current_user.username != old_username:
+            invalidate_user_pages(current_user, old_username)
+        if form.picture.data:
+            try:
+                save_picture(form.picture.data, current_user)
+            except ValueError as e:
+                flash(f"Your account was updated, but the picture was not. {e}.",
+                      "danger")
+                return redirect(url_for("users.account"))
         flash("You have successfully updated your account!", "success")
         return redirect(url_for("users.account"))
     elif request.method == "GET":
@@ -69,29 +99,33 @@ def account():
         form.email.data = current_user.email
 
     if pw_form.validate_on_submit():
-        hashed_pw = bcrypt.generate_password_hash(
-            pw_form.password.data).decode("utf-8")
+        hashed_pw = hasher.generate_password_hash(pw_form.password.data)
         current_user.password = hashed_pw
         db.session.commit()
+        invalidate_user_identity(current_user.id)
         flash("You have successfully changed your password!", "success")
         return redirect(url_for("users.account"))
-    image_file = url_for(
-        "static", filename="profile_pics/" + current_user.img_file)
     return render_template("account.html", title="Account",
-                           image_file=image_file, form=form, pw_form=pw_form)
+                           form=form, pw_form=pw_form)
 
 
 @users.route("/user/<string:username>")
+@cache.cached_page("user:{username}")
+@query_budget(5)
 def user_posts(username: str):
-    page = request.args.get("page", 1, type=int)
     user = User.query.filter_by(username=username).first_or_404()
-    posts = Post.query.filter_by(author=user) \
-        .order_by(Post.date_posted.desc())    \
-        .paginate(page=page, per_page=5)
-    return render_template("user_posts.html", posts=posts, user=user)
+    posts = paginate_posts(with_authors(Post.query.filter_by(author=user)),
+                           f"user:{user.id}", count=lambda: user.post_count)
+    etag, last_modified = feed_validators(posts, posts.total,
+                                          getattr(posts, "pages", None))
+    return not_modified(etag, last_modified) or with_validators(
+        render_template("user_posts.html", posts=posts, user=user),
+        etag, last_modified)
 
 
 @users.route("/reset_password", methods=["GET", "POST"])
+@limiter.limit("reset-ip", 5, 600)
+@limiter.limit("reset-account", 3, 3600, key=account_email)
 def reset_request():
     # If the user is already logged in, then redirect to home
     if current_user.is_authenticated:
@@ -116,9 +150,64 @@ def reset_token(token):
         return redirect(url_for("users.reset_request"))
     form = ResetPassword()
     if form.validate_on_submit():
-        hashed_pword = bcrypt.generate_password_hash(form.password.data)
+        hashed_pword = hasher.generate_password_hash(form.password.data)
         user.password = hashed_pword
         db.session.commit()
+        invalidate_user_identity(user.id)
         flash("You have successfully updated your password!", "success")
         redirect(url_for("users.login"))
     return render_template("reset_token.html", title="Reset Password", form=form)
+
+
+@users.route("/avatars/<path:filename>")
+def avatar(filename: str):
+    # Pipeline files are named by content hash, so they never change
+    response = send_from_directory(avatar_dir(), filename, max_age=31536000)
+    response.cache_control.immutable = True
+    return response
+
+
+@users.cli.command("gc-avatars")
+@click.option("--grace", default=3600, show_default=True,
+              help="Keep unreferenced files younger than this many seconds.")
+def gc_avatars_command(grace):
+    removed = collect_orphans(grace)
+    for filename in removed:
+        click.echo(f"removed {filename}")
+    click.echo(f"Removed {len(removed)} orphaned file(s).")
+
+
+@users.cli.command("import",
+                   help="Import users, skipping taken usernames and emails.")
+@click.argument("path")
+@click.option("--format", "fmt", type=click.Choice(FORMATS),
+              help="Defaults to the file extension, or jsonl.")
+@click.option("--batch-size", default=1000, show_default=True,
+              help="Rows per INSERT.")
+@click.option("--commit-every", default=50_000, show_default=True,
+              help="Rows per transaction.")
+def import_command(path, fmt, batch_size, commit_every):
+    progress = Progress("users")
+    with open_stream(path, "r") as stream:
+        try:
+            import_users(read_rows(stream, guess_format(path, fmt)), progress,
+                         batch_size, commit_every)
+        except ValueError as exc:
+            db.session.rollback()
+            raise click.ClickException(str(exc))
+    progress.done()
+
+
+@users.cli.command("export",
+                   help="Export users with their password hashes.")
+@click.argument("path", default="-")
+@click.option("--format", "fmt", type=click.Choice(FORMATS),
+              help="Defaults to the file extension, or jsonl.")
+@click.option("--batch-size", default=1000, show_default=True,
+              help="Rows fetched per round trip.")
+def export_command(path, fmt, batch_size):
+    progress = Progress("users")
+    with open_stream(path, "w") as stream:
+        write_rows(stream, guess_format(path, fmt), USER_EXPORT_FIELDS,
+                   export_users(batch_size), progress)
+    progress.done()
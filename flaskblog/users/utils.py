@@ -1,29 +1,244 @@
+import io
 import os
-import secrets
-from PIL import Image
-from flaskblog import mail
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from threading import Lock
+from time import time
+from sqlalchemy import select
+from flaskblog import cache, db, hasher, mail_queue
 from flask import url_for, current_app
-from flaskblog.models import User
-from flask_mail import Message
+from flaskblog.bulk import chunked
+from flaskblog.forking import after_fork
+from flaskblog.models import LatestPost, User, invalidate_user_identity
 
 
-def save_picture(form_picture):
-    random_hex = secrets.token_hex(8)
-    file_ext = os.path.splitext(form_picture.filename)[1]
-    new_fname = random_hex + file_ext
-    full_fname = os.path.join(current_app.root_path, "static/profile_pics", new_fname)
+AVATAR_SIZES = (64, 125, 256)
+AVATAR_FORMATS = {"webp": ("WEBP", {"quality": 80, "method": 4}),
+                  "jpg": ("JPEG", {"quality": 85, "optimize": True,
+                                   "progressive": True})}
+DEFAULT_AVATAR = "default.jpg"
 
-    img = Image.open(form_picture)
-    img.thumbnail((125, 125))
-    img.save(full_fname)
+_executor = None
+_executor_lock = Lock()
 
-    return new_fname
+
+def avatar_dir():
+    return os.path.join(current_app.root_path, "static", "profile_pics")
+
+
+def is_hashed_avatar(img_file: str):
+    # Pipeline output is stored as a bare content hash, uploads from before
+    # the pipeline kept their original extension
+    return "." not in img_file
+
+
+def avatar_filename(img_file: str, size=125, fmt="jpg"):
+    if not is_hashed_avatar(img_file):
+        return img_file
+    return f"{img_file}-{size}.{fmt}"
+
+
+def avatar_url(img_file: str, size=125, fmt="jpg"):
+    if not is_hashed_avatar(img_file):
+        return url_for("static", filename="profile_pics/" + img_file)
+    return url_for("users.avatar", filename=avatar_filename(img_file, size, fmt))
+
+
+def avatar_srcset(img_file: str, fmt="jpg"):
+    if not is_hashed_avatar(img_file):
+        return ""
+    return ", ".join(f"{avatar_url(img_file, size, fmt)} {size}w"
+                     for size in AVATAR_SIZES)
+
+
+def invalidate_user_pages(user: User, *old_usernames):
+    # Post pages are keyed on their author, so one bump covers all of them.
+    # The sidebar shows usernames, so a rename only bumps it when the user
+    # is in it
+    namespaces = ["home", f"author:{user.id}", f"user:{user.username}",
+                  *(f"user:{username}" for username in old_usernames)]
+    if old_usernames and db.session.query(LatestPost.post_id) \
+            .filter_by(user_id=user.id).first() is not None:
+        namespaces.append("latest")
+    cache.invalidate(*namespaces)
+
+
+def _write_variants(data: bytes, name: str):
+    # Pillow is only needed once someone uploads a picture
+    from PIL import Image, ImageOps
+
+    img = Image.open(io.BytesIO(data))
+    if img.format == "JPEG":
+        # Let libjpeg decode at a reduced scale instead of full resolution
+        img.draft("RGB", (max(AVATAR_SIZES), max(AVATAR_SIZES)))
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    directory = avatar_dir()
+    for size in sorted(AVATAR_SIZES, reverse=True):
+        img.thumbnail((size, size), Image.LANCZOS)
+        for fmt, (pil_format, options) in AVATAR_FORMATS.items():
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                img.save(f, pil_format, **options)
+            os.replace(tmp, os.path.join(directory, avatar_filename(name, size, fmt)))
+
+
+def _variants_exist(name: str):
+    directory = avatar_dir()
+    return all(os.path.exists(os.path.join(directory, avatar_filename(name, size, fmt)))
+               for size in AVATAR_SIZES for fmt in AVATAR_FORMATS)
+
+
+def avatar_files(img_file: str):
+    if not is_hashed_avatar(img_file):
+        return [img_file]
+    return [avatar_filename(img_file, size, fmt)
+            for size in AVATAR_SIZES for fmt in AVATAR_FORMATS]
+
+
+def retire_avatar(img_file: str):
+    # Replaced files are left to collect_orphans. Touching them starts the
+    # grace period now, so pages rendered before the change still load them
+    if img_file == DEFAULT_AVATAR:
+        return
+    for filename in avatar_files(img_file):
+        try:
+            os.utime(os.path.join(avatar_dir(), filename))
+        except FileNotFoundError:
+            pass
+
+
+def collect_orphans(grace=3600):
+    referenced = {img_file for img_file, in db.session.query(User.img_file)}
+    referenced.add(DEFAULT_AVATAR)
+    cutoff = time() - grace
+    removed = []
+    with os.scandir(avatar_dir()) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.name.startswith("."):
+                continue
+            base = entry.name.split("-", 1)[0] if "-" in entry.name else entry.name
+            if base in referenced or entry.stat().st_mtime > cutoff:
+                continue
+            os.remove(entry.path)
+            removed.append(entry.name)
+    return removed
+
+
+def _process_picture(app, user_id: int, data: bytes, name: str):
+    with app.app_context():
+        try:
+            if not _variants_exist(name):
+                _write_variants(data, name)
+        except Exception:
+            app.logger.exception("Processing profile picture for user %s failed", user_id)
+            return
+        user = User.query.get(user_id)
+        if user is None:
+            return
+        old_img_file = user.img_file
+        user.img_file = name
+        db.session.commit()
+        invalidate_user_identity(user.id)
+        invalidate_user_pages(user)
+        if old_img_file != name:
+            retire_avatar(old_img_file)
+
+
+@after_fork
+def _reset_picture_executor():
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = Lock()
+
+
+def _picture_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=current_app.config["IMAGE_WORKERS"],
+                thread_name_prefix="profile-pics")
+        return _executor
+
+
+def _check_picture(data: bytes):
+    from PIL import Image, UnidentifiedImageError
+
+    # Only the header is read here, decoding happens in the background
+    try:
+        Image.open(io.BytesIO(data))
+    except (UnidentifiedImageError, Image.DecompressionBombError) as e:
+        raise ValueError("That file is not an image we can read") from e
+
+
+def save_picture(form_picture, user: User):
+    data = form_picture.read()
+    _check_picture(data)
+    # Identical uploads share one set of files
+    name = sha256(data).hexdigest()[:16]
+    app = current_app._get_current_object()
+    if not current_app.config["IMAGE_WORKERS"]:
+        _process_picture(app, user.id, data, name)
+    else:
+        _picture_executor().submit(_process_picture, app, user.id, data, name)
 
 
 def send_reset_email(user: User):
+    from flask_mail import Message
+
     token = user.get_reset_token()
     msg = Message("Password Reset for 'flaskblog'", sender="noreply@demo.com",
                   recipients=[user.email])
     msg.body = "To reset your password, please visit the following link: \n"\
         f"{url_for('users.reset_token', token=token, _external=True)}"
-    mail.send(msg)
+    mail_queue.enqueue(msg)
+
+
+USER_EXPORT_FIELDS = ("username", "email", "password_hash", "img_file")
+
+
+def _existing(column, values):
+    return {value for value, in db.session.query(column).filter(column.in_(values))}
+
+
+def import_users(rows, progress, batch_size=1000, commit_every=50_000):
+    uncommitted = 0
+    for chunk in chunked(rows, batch_size):
+        for number, row in enumerate(chunk, progress.count + progress.skipped + 1):
+            if not row.get("username") or not row.get("email") \
+                    or not (row.get("password") or row.get("password_hash")):
+                raise ValueError(f"row {number}: username, email and a password "
+                                 "or password_hash are required")
+        # Earlier chunks are already inserted in this transaction, so the
+        # lookup also catches duplicates within the file
+        taken_usernames = _existing(User.username, {row["username"] for row in chunk})
+        taken_emails = _existing(User.email, {row["email"] for row in chunk})
+        fresh = []
+        for row in chunk:
+            if row["username"] in taken_usernames or row["email"] in taken_emails:
+                continue
+            taken_usernames.add(row["username"])
+            taken_emails.add(row["email"])
+            fresh.append(row)
+
+        plain = [row for row in fresh if not row.get("password_hash")]
+        hashes = iter(hasher.generate_password_hashes([row["password"] for row in plain]))
+        values = [{"username": row["username"], "email": row["email"],
+                   "img_file": row.get("img_file") or DEFAULT_AVATAR,
+                   "password": row.get("password_hash") or next(hashes)}
+                  for row in fresh]
+        if values:
+            db.session.execute(User.__table__.insert(), values)
+        uncommitted += len(values)
+        if uncommitted >= commit_every:
+            db.session.commit()
+            uncommitted = 0
+        progress.update(len(values), skipped=len(chunk) - len(values))
+    db.session.commit()
+
+
+def export_users(batch_size=1000):
+    query = select(User.username, User.email, User.password, User.img_file) \
+        .order_by(User.id).execution_options(yield_per=batch_size)
+    return db.session.execute(query)
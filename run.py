@@ -1,6 +1,10 @@
+import gc
 from flaskblog import create_app
 
 app = create_app()
+# Under a preloading pre-fork server (gunicorn --preload run:app) workers
+# share the master's pages, freezing keeps the collector from copying them
+gc.freeze()
 
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
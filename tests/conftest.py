@@ -0,0 +1,52 @@
+import pytest
+from flaskblog import create_app, db, hasher
+from flaskblog.config import Config
+from flaskblog.models import Post, User
+
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        TESTING = True
+        SECRET_KEY = "test"
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+        WTF_CSRF_ENABLED = False
+        CACHE_TYPE = "memory"
+        BCRYPT_LOG_ROUNDS = 4
+        HASH_POOL_SIZE = 0
+        MAIL_QUEUE_WORKER = False
+        IMAGE_WORKERS = 0
+        RATELIMIT_ENABLED = False
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        for name in ("amy", "bob"):
+            db.session.add(User(username=name, email=f"{name}@example.com",
+                                password=hasher.generate_password_hash("pw")))
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.drop_all()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def posts(app):
+    # Posts from more than one author, so per-row author queries would show
+    for name in ("amy", "bob"):
+        client = app.test_client()
+        login(client, name)
+        for n in range(3):
+            new_post(client, f"{name} {n}")
+    with app.app_context():
+        return [post_id for post_id, in Post.query.with_entities(Post.id)]
+
+
+def login(client, name):
+    client.post("/login", data={"email": f"{name}@example.com", "password": "pw"})
+
+
+def new_post(client, title):
+    response = client.post("/post/new", data={"title": title, "content": "text"})
+    assert response.status_code == 302
@@ -0,0 +1,114 @@
+import pytest
+from flask import g
+from flaskblog.models import Post
+from flaskblog.queries import QueryBudgetExceeded
+from tests.conftest import login, new_post
+
+
+@pytest.mark.parametrize("path", ["/", "/home?page=2", "/post/{id}",
+                                  "/user/amy", "/user/bob?page=1"])
+@pytest.mark.parametrize("logged_in", [False, True])
+def test_pages_stay_within_query_budget(app, posts, path, logged_in):
+    client = app.test_client()
+    if logged_in:
+        login(client, "amy")
+    # Budgets are enforced with an exception while testing
+    with client:
+        response = client.get(path.format(id=posts[0]))
+        assert response.status_code == 200
+        assert g.query_count <= g.query_budget
+
+
+def test_query_budget_raises_when_exceeded(app):
+    from flaskblog.queries import query_budget
+
+    @query_budget(0)
+    def view():
+        Post.query.count()
+        return ""
+
+    app.add_url_rule("/over-budget", "over_budget", view)
+    with pytest.raises(QueryBudgetExceeded):
+        app.test_client().get("/over-budget")
+
+
+@pytest.mark.parametrize("path", ["/", "/post/{id}", "/user/bob"])
+def test_cached_pages_show_new_posts_in_sidebar(app, posts, path):
+    reader = app.test_client()
+    path = path.format(id=posts[0])
+    assert reader.get(path).headers["X-Cache"] == "MISS"
+    assert reader.get(path).headers["X-Cache"] == "HIT"
+
+    author = app.test_client()
+    login(author, "amy")
+    new_post(author, "Fresh from amy")
+
+    response = reader.get(path)
+    assert response.headers["X-Cache"] == "MISS"
+    assert b"Fresh from amy" in response.data
+
+
+def _update_account(client, username, email):
+    response = client.post("/account", data={"username": username, "email": email})
+    assert response.status_code == 302
+
+
+def test_rename_rebuilds_the_authors_post_pages(app, posts):
+    reader = app.test_client()
+    path = f"/post/{posts[0]}"
+    reader.get(path)
+    assert reader.get(path).headers["X-Cache"] == "HIT"
+
+    author = app.test_client()
+    login(author, "amy")
+    _update_account(author, "amelia", "amy@example.com")
+
+    response = reader.get(path)
+    assert response.headers["X-Cache"] == "MISS"
+    assert b"amelia" in response.data
+
+
+def test_email_change_keeps_cached_pages(app, posts):
+    reader = app.test_client()
+    paths = ["/", f"/post/{posts[0]}", "/user/amy"]
+    for path in paths:
+        reader.get(path)
+
+    author = app.test_client()
+    login(author, "amy")
+    _update_account(author, "amy", "amy@example.org")
+
+    for path in paths:
+        assert reader.get(path).headers["X-Cache"] == "HIT"
+
+
+def test_editing_an_old_post_keeps_other_pages(app, posts):
+    # With six posts and a five-post sidebar, the first one is not in it
+    reader = app.test_client()
+    paths = [f"/post/{posts[1]}", "/user/bob"]
+    for path in paths:
+        reader.get(path)
+
+    author = app.test_client()
+    login(author, "amy")
+    response = author.post(f"/post/{posts[0]}/update",
+                           data={"title": "Retitled", "content": "edited"})
+    assert response.status_code == 302
+
+    for path in paths:
+        assert reader.get(path).headers["X-Cache"] == "HIT"
+    assert b"Retitled" in reader.get(f"/post/{posts[0]}").data
+
+
+def test_renaming_a_sidebar_author_rebuilds_every_page(app, posts):
+    reader = app.test_client()
+    path = f"/post/{posts[0]}"
+    reader.get(path)
+
+    author = app.test_client()
+    login(author, "bob")
+    _update_account(author, "robert", "bob@example.com")
+
+    response = reader.get(path)
+    assert response.headers["X-Cache"] == "MISS"
+    assert b"robert" in response.data
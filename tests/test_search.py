@@ -0,0 +1,14 @@
+from tests.conftest import login
+
+
+def test_control_characters_in_posts_do_not_become_marks(app):
+    author = app.test_client()
+    login(author, "amy")
+    author.post("/post/new", data={"title": "needle \x03 title",
+                                   "content": "\x02 haystack needle \x03"})
+
+    response = app.test_client().get("/search?q=needle")
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert body.count("<mark>") == body.count("</mark>") == 2
+    assert "<mark>needle</mark> \x03 title" in body